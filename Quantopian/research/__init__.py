@@ -0,0 +1,79 @@
+"""
+Local implementations of the research-environment helpers used by the lecture
+scripts in this directory.
+"""
+from .assets import AssetFrame, AssetRegistry, Equity
+from .batch import BatchFetcher, get_pricing_batch
+from .cache import PricingCache
+from .calendars import TradingCalendar, get_calendar
+from .covariance import OnlineCovariance, pairwise_corr, pairwise_cov
+from .density import PairDensity, pair_density, scatter
+from .factor import FactorCovariance
+from .histogram import Histogram, histogram
+from .normalize import ZScorer, zscore
+from .optimize import MeanVarianceOptimizer
+from .plotting import downsample, plot
+from .portfolio import evaluate_portfolios
+from .query import Filter, query
+from .ragged import RaggedPanel
+from .resample import Buckets, resample
+from .returns import returns
+from .rolling import RollingWindow, rolling_mean, rolling_stats, rolling_std
+from .simulate import UniverseSimulator, simulate_universe
+from .sketch import QuantileSketch, sketch
+from .store import (
+    FIELDS,
+    PriceStore,
+    SymbolNotFound,
+    get_price_store,
+    get_pricing,
+    set_price_store,
+)
+from .timezones import tz_convert
+
+__all__ = [
+    'AssetFrame',
+    'AssetRegistry',
+    'BatchFetcher',
+    'Buckets',
+    'Equity',
+    'FIELDS',
+    'FactorCovariance',
+    'Filter',
+    'Histogram',
+    'MeanVarianceOptimizer',
+    'OnlineCovariance',
+    'PairDensity',
+    'PriceStore',
+    'PricingCache',
+    'QuantileSketch',
+    'RaggedPanel',
+    'RollingWindow',
+    'SymbolNotFound',
+    'TradingCalendar',
+    'UniverseSimulator',
+    'ZScorer',
+    'downsample',
+    'evaluate_portfolios',
+    'get_calendar',
+    'get_price_store',
+    'get_pricing',
+    'get_pricing_batch',
+    'histogram',
+    'pair_density',
+    'pairwise_corr',
+    'pairwise_cov',
+    'plot',
+    'query',
+    'resample',
+    'returns',
+    'rolling_mean',
+    'rolling_stats',
+    'rolling_std',
+    'scatter',
+    'set_price_store',
+    'simulate_universe',
+    'sketch',
+    'tz_convert',
+    'zscore',
+]
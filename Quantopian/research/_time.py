@@ -0,0 +1,44 @@
+"""
+Conversions between pandas timestamps and the int64 nanosecond axis used by
+the on-disk structures in this package.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pandas as pd
+
+
+def to_nanos(value):
+    """Convert a date-like value to int64 nanoseconds since the epoch (UTC).
+
+    Naive values are interpreted as UTC.
+    """
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return int(ts.value)
+
+
+def index_nanos(index):
+    """Return the UTC int64 nanosecond values of a datetime index.
+
+    No copy is made when the index is already stored at nanosecond resolution.
+    """
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return np.asarray(index.values, dtype='datetime64[ns]').view('i8')
+
+
+def nanos_index(nanos, tz='UTC'):
+    """Build a tz-aware DatetimeIndex from int64 UTC nanoseconds."""
+    nanos = np.asarray(nanos, dtype='i8')
+    index = pd.DatetimeIndex(nanos.view('datetime64[ns]')).tz_localize('UTC')
+    if tz is not None and tz != 'UTC':
+        index = index.tz_convert(tz)
+    return index
+
+
+def index_key(nanos):
+    """Hashable key identifying the values of an int64 nanosecond axis."""
+    return len(nanos), hash(nanos.tobytes())
@@ -0,0 +1,276 @@
+"""
+Asset objects returned as the columns of multi-symbol pricing frames.
+
+The lecture scripts rename columns with ``[e.symbol for e in data.columns]``,
+so these objects mirror the hosted ``Equity`` type closely enough for that
+idiom to keep working.
+
+:class:`AssetRegistry` interns equities to compact integer ids and resolves
+symbols as of a date, so panels can be labelled by integer (cheap to compare,
+hash and join) while :class:`AssetFrame` keeps ``prices.CMG``-style access
+working without renaming the columns after every fetch.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pandas as pd
+
+from ._time import to_nanos
+
+_ALWAYS = (-2 ** 63, 2 ** 63 - 1)
+
+
+class Equity(object):
+    """An equity identified by an integer ``sid``.
+
+    Parameters
+    ----------
+    sid : int
+        Stable integer identifier of the asset.
+    symbol : str
+        Ticker symbol.
+    start_date, end_date : pd.Timestamp, optional
+        First and last dates for which the asset has pricing data.
+    """
+    __slots__ = ('sid', 'symbol', 'start_date', 'end_date')
+
+    def __init__(self, sid, symbol, start_date=None, end_date=None):
+        self.sid = int(sid)
+        self.symbol = symbol
+        self.start_date = None if start_date is None else pd.Timestamp(start_date)
+        self.end_date = None if end_date is None else pd.Timestamp(end_date)
+
+    def __int__(self):
+        return self.sid
+
+    def __index__(self):
+        return self.sid
+
+    def __hash__(self):
+        return hash(self.sid)
+
+    def __eq__(self, other):
+        if isinstance(other, Equity):
+            return self.sid == other.sid
+        if isinstance(other, int):
+            return self.sid == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __lt__(self, other):
+        return self.sid < int(other)
+
+    def __le__(self, other):
+        return self.sid <= int(other)
+
+    def __gt__(self, other):
+        return self.sid > int(other)
+
+    def __ge__(self, other):
+        return self.sid >= int(other)
+
+    def __repr__(self):
+        return 'Equity(%d [%s])' % (self.sid, self.symbol)
+
+    def __reduce__(self):
+        return (Equity, (self.sid, self.symbol, self.start_date, self.end_date))
+
+
+class AssetRegistry(object):
+    """Interned equities with a point-in-time symbol index.
+
+    Every equity gets a compact id, its position in the registry, so a
+    panel's columns can be an int64 index. Symbols are kept with the dates
+    they were in use, so a ticker that changed hands resolves to the right
+    asset for any date. Renames are recorded in the registry only; the
+    interned :class:`Equity` objects, which may be shared with a
+    :class:`~research.store.PriceStore`, keep the symbol they were created
+    with.
+
+    Examples
+    --------
+    >>> registry = AssetRegistry()
+    >>> fb = registry.add(1, 'FB', start_date='2012-05-18')
+    >>> _ = registry.rename('FB', 'META', '2022-06-09')
+    >>> registry.lookup('FB', as_of='2015-01-02')
+    Equity(1 [FB])
+    >>> registry.symbol_of(fb), registry.symbol_of(fb, as_of='2015-01-02')
+    ('META', 'FB')
+    """
+
+    def __init__(self, equities=()):
+        self._equities = []
+        self._ids = {}
+        self._symbols = {}
+        self._history = []
+        for equity in equities:
+            self.intern(equity)
+
+    def __len__(self):
+        return len(self._equities)
+
+    def __iter__(self):
+        return iter(self._equities)
+
+    def __contains__(self, asset):
+        if isinstance(asset, Equity):
+            return asset.sid in self._ids
+        return asset in self._symbols
+
+    def __getitem__(self, asset_id):
+        """The equity with id ``asset_id``."""
+        return self._equities[asset_id]
+
+    def intern(self, equity):
+        """Return the id of ``equity``, registering it under its current
+        symbol if it is new. Equal equities always share one object."""
+        try:
+            return self._ids[equity.sid]
+        except KeyError:
+            pass
+        asset_id = len(self._equities)
+        self._equities.append(equity)
+        self._ids[equity.sid] = asset_id
+        start = _ALWAYS[0] if equity.start_date is None \
+            else to_nanos(equity.start_date)
+        self._history.append([(start, equity.symbol)])
+        self._symbols.setdefault(equity.symbol, []).append(
+            [start, _ALWAYS[1], asset_id])
+        return asset_id
+
+    def add(self, sid, symbol, start_date=None, end_date=None):
+        """Create, intern and return an :class:`Equity`."""
+        asset_id = self.intern(Equity(sid, symbol, start_date, end_date))
+        return self._equities[asset_id]
+
+    def rename(self, asset, symbol, as_of):
+        """Record that ``asset`` trades as ``symbol`` from ``as_of`` on.
+
+        The old symbol keeps resolving to ``asset`` for earlier dates and
+        may be given to another asset afterwards.
+        """
+        asset_id = self.id_of(asset)
+        when = to_nanos(as_of)
+        for entry in self._symbols.get(self.symbol_of(asset_id), ()):
+            if entry[2] == asset_id and entry[1] == _ALWAYS[1]:
+                entry[1] = when
+        self._symbols.setdefault(symbol, []).append(
+            [when, _ALWAYS[1], asset_id])
+        self._symbols[symbol].sort()
+        self._history[asset_id].append((when, symbol))
+        return self._equities[asset_id]
+
+    def lookup(self, symbol, as_of=None):
+        """The equity trading as ``symbol`` on ``as_of``, or most recently
+        when no date is given. Raises ``KeyError`` for unknown symbols."""
+        return self._equities[self.id_of(symbol, as_of)]
+
+    def id_of(self, asset, as_of=None):
+        """The id of an equity or of a symbol (resolved as of ``as_of``).
+        Integers are taken to be ids already."""
+        if isinstance(asset, Equity):
+            return self._ids[asset.sid]
+        if isinstance(asset, (int, np.integer)):
+            if not 0 <= asset < len(self._equities):
+                raise KeyError('no asset with id %d' % asset)
+            return int(asset)
+        entries = self._symbols.get(asset)
+        if entries:
+            if as_of is None:
+                # The current holder, else the most recent one.
+                return max(entries, key=lambda entry: entry[1::-1])[2]
+            when = to_nanos(as_of)
+            for start, end, asset_id in entries:
+                if start <= when < end:
+                    return asset_id
+        raise KeyError('no asset with symbol %r%s' % (
+            asset, '' if as_of is None else ' on %s' % (as_of,)))
+
+    def ids(self, assets, as_of=None):
+        """Ids of many equities or symbols as an int64 array."""
+        return np.array([self.id_of(asset, as_of) for asset in assets],
+                        dtype=np.int64)
+
+    def symbol_of(self, asset, as_of=None):
+        """The symbol ``asset`` traded as on ``as_of`` (or today)."""
+        asset_id = self.id_of(asset)
+        history = self._history[asset_id]
+        if as_of is None:
+            return history[-1][1]
+        when = to_nanos(as_of)
+        symbol = history[0][1]
+        for start, name in history:
+            if start <= when:
+                symbol = name
+        return symbol
+
+    def frame(self, data, as_of=None):
+        """Relabel the columns of ``data`` (equities or symbols) with ids and
+        return it as an :class:`AssetFrame`, without copying the values."""
+        ids = self.ids(data.columns, as_of)
+        out = AssetFrame(data.values, index=data.index,
+                         columns=pd.Index(ids, dtype=np.int64), copy=False)
+        out.registry = self
+        out.as_of = as_of
+        return out
+
+
+class AssetFrame(pd.DataFrame):
+    """A DataFrame whose columns are :class:`AssetRegistry` ids.
+
+    Columns compare and join as integers, while ``prices.CMG``,
+    ``prices['CMG']`` and ``prices[['CMG', 'MCD']]`` still resolve symbols
+    through the registry (as of ``as_of``, if set).
+    """
+    _metadata = ['registry', 'as_of']
+    registry = None
+    as_of = None
+
+    @property
+    def _constructor(self):
+        return AssetFrame
+
+    def _column_key(self, key):
+        registry = getattr(self, 'registry', None)
+        if registry is None:
+            return key
+        if isinstance(key, str):
+            return registry.id_of(key, self.as_of)
+        if isinstance(key, Equity):
+            return registry.id_of(key)
+        if isinstance(key, list) and key and \
+                all(isinstance(k, (str, Equity)) for k in key):
+            return [self._column_key(k) for k in key]
+        return key
+
+    def __getitem__(self, key):
+        return super(AssetFrame, self).__getitem__(self._column_key(key))
+
+    def __getattr__(self, name):
+        if not name.startswith('_'):
+            registry = self.registry
+            if registry is not None:
+                try:
+                    asset_id = registry.id_of(name, self.as_of)
+                except KeyError:
+                    pass
+                else:
+                    if asset_id in self.columns:
+                        return self[asset_id]
+        return super(AssetFrame, self).__getattr__(name)
+
+    @property
+    def symbols(self):
+        """Symbols of the columns, as of ``as_of``."""
+        return [self.registry.symbol_of(asset_id, self.as_of)
+                for asset_id in self.columns]
+
+    @property
+    def equities(self):
+        """Equities of the columns."""
+        return [self.registry[asset_id] for asset_id in self.columns]
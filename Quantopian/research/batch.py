@@ -0,0 +1,132 @@
+"""
+Concurrent multi-symbol fetches with request coalescing.
+
+``Panda.py`` issues several ``get_pricing`` calls one after another and then
+``pd.concat``s the results. :class:`BatchFetcher` takes all of the symbol
+groups at once, loads every (symbol, field) on a thread pool, shares a single
+in-flight load between callers asking for the same symbol and range, and
+writes the results into one preallocated, date-aligned block.
+"""
+from __future__ import absolute_import, division, print_function
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ._time import index_nanos, nanos_index, to_nanos
+from .store import _frame, get_pricing, string_types
+
+
+class BatchFetcher(object):
+    """Thread-pooled, coalescing front end to a ``get_pricing`` loader.
+
+    Parameters
+    ----------
+    loader : callable, optional
+        Called as ``loader(symbol, start_date=..., end_date=..., fields=...)``
+        and expected to return a Series. Defaults to
+        :func:`research.store.get_pricing`; a
+        :meth:`research.cache.PricingCache.get_pricing` works as well.
+    max_workers : int
+        Size of the thread pool.
+    """
+
+    def __init__(self, loader=None, max_workers=8):
+        self.loader = get_pricing if loader is None else loader
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = {}
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def submit(self, symbol, field, start_date, end_date):
+        """Schedule a load, returning the in-flight future if an identical
+        request is already running."""
+        key = (symbol, field, to_nanos(start_date), to_nanos(end_date))
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(
+                    self.loader, symbol, start_date=start_date,
+                    end_date=end_date, fields=field,
+                )
+                self._pending[key] = future
+                future.add_done_callback(
+                    lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def fetch(self, groups, start_date, end_date, fields='price'):
+        """Load several symbol groups into one aligned frame.
+
+        Parameters
+        ----------
+        groups : iterable
+            Symbol groups as passed to separate ``get_pricing`` calls, e.g.
+            ``[['SPY', 'VXX'], ['MSFT', 'AAPL', 'GOOG'], 'TSLA']``. Symbols
+            repeated across groups are loaded once.
+        start_date, end_date : date-like
+            Inclusive bounds shared by every group.
+        fields : str or list of str
+            Field or fields to load.
+
+        Returns
+        -------
+        pd.DataFrame
+            Equity (or symbol) columns in first-seen order for a single field,
+            (field, asset) MultiIndex columns otherwise, indexed by the union
+            of the loaded dates.
+        """
+        symbols = []
+        seen = set()
+        for group in groups:
+            if isinstance(group, string_types) or not hasattr(group, '__iter__'):
+                group = [group]
+            for symbol in group:
+                symbol = getattr(symbol, 'symbol', symbol)
+                if symbol not in seen:
+                    seen.add(symbol)
+                    symbols.append(symbol)
+        single_field = isinstance(fields, string_types)
+        fields = [fields] if single_field else list(fields)
+
+        futures = [[self.submit(symbol, field, start_date, end_date)
+                    for symbol in symbols] for field in fields]
+        loaded = [[future.result() for future in row] for row in futures]
+
+        nanos = [index_nanos(series.index) for row in loaded for series in row]
+        dates = np.unique(np.concatenate(nanos)) if nanos \
+            else np.empty(0, dtype='i8')
+        values = np.full((len(fields), len(symbols), len(dates)), np.nan)
+        flat = values.reshape(len(fields) * len(symbols), len(dates))
+        for row, (series, series_nanos) in enumerate(
+                zip((s for r in loaded for s in r), nanos)):
+            flat[row, np.searchsorted(dates, series_nanos)] = series.values
+
+        assets = [series.name if series.name is not None else symbol
+                  for symbol, series in zip(symbols, loaded[0])] \
+            if loaded else symbols
+        return _frame(nanos_index(dates), values, assets, fields,
+                      single_asset=False, single_field=single_field)
+
+
+def get_pricing_batch(groups, start_date, end_date, fields='price',
+                      loader=None, max_workers=8):
+    """Load several symbol groups concurrently into one aligned frame.
+
+    See :meth:`BatchFetcher.fetch`.
+    """
+    with BatchFetcher(loader=loader, max_workers=max_workers) as fetcher:
+        return fetcher.fetch(groups, start_date, end_date, fields=fields)
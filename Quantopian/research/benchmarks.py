@@ -0,0 +1,430 @@
+"""
+Benchmarks of the operations the lecture scripts perform.
+
+``Introduccion.py`` times a ``for i in range(10000000)`` loop to show why
+vectorised code matters, but nothing tracks the speed of the code here.
+Each case below times the lecture idiom (``np.cov(returns)``,
+``prices.pct_change()``, ``pd.rolling_mean``...) next to the equivalent in
+this package, on synthetic panels of three sizes, and measures the peak
+memory the call allocates. Runs are appended to a JSON history. When a
+stored baseline exists, each result is compared with it, and any that got
+slower or larger beyond a tolerance is reported, as is any result over its
+fixed time budget in :data:`BUDGETS`.
+
+Usage::
+
+    python -m research.benchmarks                  # all cases, all sizes
+    python -m research.benchmarks --sizes small --cases cov rolling
+    python -m research.benchmarks --save-baseline  # accept this run
+
+Timings depend on the machine, so the baseline should be recorded on the
+machine that runs the comparison. The package's own caches (e.g. calendar
+indexers) stay warm across repeats, as they would in a research session.
+History and baseline live in ``~/.quantopian/benchmarks`` unless
+``$QUANTOPIAN_BENCHMARKS`` names another directory.
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .batch import get_pricing_batch
+from .calendars import reindex
+from .covariance import pairwise_cov
+from .factor import FactorCovariance
+from .optimize import MeanVarianceOptimizer
+from .portfolio import evaluate_portfolios
+from .query import query
+from .resample import _offset, resample
+from .returns import returns
+from .rolling import rolling_stats
+from .simulate import simulate_universe
+from .store import _makedirs
+
+#: ``(n_assets, n_days)`` of the synthetic panels.
+SIZES = OrderedDict([
+    ('small', (20, 504)),
+    ('medium', (200, 2520)),
+    ('large', (1000, 10080)),
+])
+
+# Outside the source tree by default, so runs never leave files in the repo.
+_DIRECTORY = os.environ.get(
+    'QUANTOPIAN_BENCHMARKS',
+    os.path.join(os.path.expanduser('~'), '.quantopian', 'benchmarks'))
+_HISTORY_FILE = os.path.join(_DIRECTORY, 'history.json')
+_BASELINE_FILE = os.path.join(_DIRECTORY, 'baseline.json')
+_TOLERANCE = 1.25
+_REPEATS = 5
+_N_PORTFOLIOS = 1000
+_N_FACTORS = 20
+
+#: Upper limits in seconds for individual results, checked on every run.
+BUDGETS = {
+    # A daily rebalance of a 3,000-name book.
+    'rebalance/warm/large': 1.0,
+    'rebalance_dense/warm/large': 1.0,
+}
+
+CASES = OrderedDict()
+
+
+def _case(name):
+    """Register a case: a function of ``(n_assets, n_days)`` returning
+    ``{variant: callable}``, built outside of the timed region."""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def _prices(n_assets, n_days, seed=0):
+    """Business-day price panel in which a fifth of the assets list late,
+    leaving leading NaNs as in the lecture's ``SHAK``."""
+    rng = np.random.RandomState(seed)
+    gross = rng.normal(1.0005, 0.02, (n_days, n_assets))
+    prices = 100 * np.cumprod(gross, axis=0)
+    late = rng.rand(n_assets) < 0.2
+    starts = rng.randint(0, n_days // 2, n_assets)
+    prices[np.arange(n_days)[:, np.newaxis] < np.where(late, starts, 0)] = \
+        np.nan
+    index = pd.bdate_range('2000-01-03', periods=n_days)
+    columns = ['S%d' % i for i in range(n_assets)]
+    return pd.DataFrame(prices, index=index, columns=columns)
+
+
+@_case('simulate')
+def _simulate(n_assets, n_days):
+    def loop():
+        # Numpy.py: one asset at a time on top of the base asset.
+        rng = np.random.RandomState(0)
+        base = rng.normal(1.01, 0.03, n_days)
+        out = np.empty((n_assets, n_days))
+        out[0] = base
+        for i in range(1, n_assets):
+            out[i] = base + rng.normal(0.001, 0.02, n_days)
+        return np.cumprod(out, axis=1)
+    return OrderedDict([
+        ('loop', loop),
+        ('research', lambda: simulate_universe(n_assets, n_days, seed=0)),
+    ])
+
+
+@_case('cov')
+def _cov(n_assets, n_days):
+    values = returns(_prices(n_assets, n_days), 'simple').values[1:].T
+    complete = np.nan_to_num(values)
+    return OrderedDict([
+        ('numpy', lambda: np.cov(complete)),
+        ('research', lambda: pairwise_cov(values)),
+    ])
+
+
+@_case('portfolio_variance')
+def _portfolio_variance(n_assets, n_days):
+    rng = np.random.RandomState(0)
+    cov = np.cov(rng.normal(0.0, 0.02, (n_assets, min(n_days, 4 * n_assets))))
+    mean = rng.normal(0.0005, 0.0002, n_assets)
+    weights = rng.rand(_N_PORTFOLIOS, n_assets)
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    def loop():
+        # Numpy.py: one weight vector at a time.
+        return [(np.dot(w, mean), np.sqrt(np.dot(np.dot(w, cov), w.T)))
+                for w in weights]
+    return OrderedDict([
+        ('numpy', loop),
+        ('research', lambda: evaluate_portfolios(weights, mean, cov)),
+    ])
+
+
+def _rebalance_days(n_names, mean_return):
+    """Two days of inputs for a ``n_names`` book on a 20-factor risk model;
+    the second moves the expected returns and loadings slightly."""
+    rng = np.random.RandomState(0)
+    loadings = rng.normal(0.0, 0.01, (n_names, _N_FACTORS))
+    loadings[:, 0] += 0.01
+    specific = rng.uniform(1e-4, 4e-4, n_names)
+    mean = rng.normal(mean_return, 0.0005, n_names)
+    return [(mean, FactorCovariance(loadings, np.eye(_N_FACTORS), specific)),
+            (mean + rng.normal(0.0, 5e-5, n_names),
+             FactorCovariance(loadings + rng.normal(0.0, 5e-4, loadings.shape),
+                              np.eye(_N_FACTORS), specific))]
+
+
+def _rebalance_variants(days):
+    optimizer = MeanVarianceOptimizer(*days[0])
+    optimizer.max_sharpe()
+    turn = [0]
+
+    def warm():
+        # Alternate between the two days so every call starts from the
+        # other day's solution.
+        turn[0] ^= 1
+        return optimizer.update(*days[turn[0]]).max_sharpe()
+    return OrderedDict([
+        ('cold', lambda: MeanVarianceOptimizer(*days[1]).max_sharpe()),
+        ('warm', warm),
+    ])
+
+
+@_case('rebalance')
+def _rebalance(n_assets, n_days):
+    # The book is three times the panel width, so the large size is a
+    # 3,000-name universe.
+    return _rebalance_variants(_rebalance_days(3 * n_assets, 0.0003))
+
+
+@_case('rebalance_dense')
+def _rebalance_dense(n_assets, n_days):
+    # The same book on the dense covariance, with expected returns high
+    # enough that the large size holds most of the universe (about 1,800
+    # of 3,000 names), so the free block is large and many names change.
+    days = [(mean, cov.to_dense())
+            for mean, cov in _rebalance_days(3 * n_assets, 0.0012)]
+    return _rebalance_variants(days)
+
+
+@_case('pct_change')
+def _pct_change(n_assets, n_days):
+    prices = _prices(n_assets, n_days)
+    return OrderedDict([
+        # prices.pct_change() without filling gaps, spelled so that it
+        # neither warns nor depends on the pandas version.
+        ('pandas', lambda: prices / prices.shift(1) - 1),
+        ('research', lambda: returns(prices, 'simple')),
+    ])
+
+
+@_case('rolling')
+def _rolling(n_assets, n_days):
+    prices = _prices(n_assets, n_days)
+
+    def pandas():
+        window = prices.rolling(30)
+        return window.mean(), window.std()
+    return OrderedDict([
+        ('pandas', pandas),
+        ('research', lambda: rolling_stats(prices, [30])),
+    ])
+
+
+@_case('resample')
+def _resample(n_assets, n_days):
+    prices = _prices(n_assets, n_days)
+    return OrderedDict([
+        ('pandas', lambda: prices.resample(_offset('M')).median()),
+        ('research', lambda: resample(prices, 'M', 'median')),
+    ])
+
+
+@_case('reindex_ffill')
+def _reindex_ffill(n_assets, n_days):
+    prices = _prices(n_assets, n_days)
+    days = pd.date_range(prices.index[0], prices.index[-1], freq='D')
+    return OrderedDict([
+        ('pandas', lambda: prices.reindex(days, method='ffill')),
+        ('research', lambda: reindex(prices, days, 'ffill')),
+    ])
+
+
+@_case('concat')
+def _concat(n_assets, n_days):
+    prices = _prices(n_assets, n_days)
+    series = [prices[column].dropna() for column in prices.columns]
+    by_symbol = dict(zip(prices.columns, series))
+    # Panda.py fetches a few symbols per get_pricing call.
+    groups = [list(prices.columns[i:i + 10]) for i in range(0, n_assets, 10)]
+
+    def loader(symbol, start_date=None, end_date=None, fields=None):
+        return by_symbol[symbol]
+    return OrderedDict([
+        ('pandas', lambda: pd.concat(series, axis=1)),
+        ('research', lambda: get_pricing_batch(
+            groups, prices.index[0], prices.index[-1], loader=loader)),
+    ])
+
+
+@_case('filter')
+def _filter(n_assets, n_days):
+    prices = _prices(n_assets, n_days)
+    expression = '(S0 > S1) & ~S%d.isnull()' % (n_assets - 1)
+    return OrderedDict([
+        ('pandas', lambda: prices.loc[(prices.S0 > prices.S1)
+                                      & ~prices[prices.columns[-1]].isnull()]),
+        ('research', lambda: query(prices, expression)),
+    ])
+
+
+def measure(func, repeats=_REPEATS):
+    """Best time per call over ``repeats`` timed loops, and the peak bytes
+    allocated by one call as seen by ``tracemalloc``.
+
+    Returns
+    -------
+    dict
+        ``{'seconds': float, 'peak_bytes': int}``
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeats, number)) / number
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak}
+
+
+def run(cases=None, sizes=None, repeats=_REPEATS, verbose=False):
+    """Measure every variant of ``cases`` at ``sizes``.
+
+    Returns
+    -------
+    OrderedDict
+        ``{'<case>/<variant>/<size>': measurement}``; see :func:`measure`.
+    """
+    cases = list(CASES) if cases is None else cases
+    sizes = list(SIZES) if sizes is None else sizes
+    unknown = (set(cases) - set(CASES)) | (set(sizes) - set(SIZES))
+    if unknown:
+        raise ValueError('unknown cases or sizes: %s' % sorted(unknown))
+    results = OrderedDict()
+    for size in sizes:
+        for case in cases:
+            for variant, func in CASES[case](*SIZES[size]).items():
+                key = '%s/%s/%s' % (case, variant, size)
+                results[key] = measure(func, repeats)
+                if verbose:
+                    print('%-40s %10.3f ms %10.1f MB'
+                          % (key, 1e3 * results[key]['seconds'],
+                             results[key]['peak_bytes'] / 2 ** 20))
+    return results
+
+
+def _load(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _dump(obj, path):
+    _makedirs(os.path.dirname(path) or '.')
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=1)
+    os.rename(tmp, path)
+
+
+def record(results, path=_HISTORY_FILE):
+    """Append a run to the JSON history at ``path`` and return the entry."""
+    entry = OrderedDict([
+        ('time', datetime.datetime.now().isoformat()),
+        ('machine', platform.node()),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('pandas', pd.__version__),
+        ('results', results),
+    ])
+    history = _load(path, [])
+    history.append(entry)
+    _dump(history, path)
+    return entry
+
+
+def load_history(path=_HISTORY_FILE):
+    """Every run recorded at ``path``, oldest first."""
+    return _load(path, [])
+
+
+def save_baseline(results, path=_BASELINE_FILE):
+    """Store ``results`` as the baseline later runs are compared with.
+    Results for cases or sizes not in this run are kept."""
+    baseline = _load(path, {})
+    baseline.update(results)
+    _dump(baseline, path)
+
+
+def regressions(results, baseline, tolerance=_TOLERANCE):
+    """Results slower or larger than ``tolerance`` times their baseline.
+
+    Parameters
+    ----------
+    results, baseline : dict
+        Outputs of :func:`run`; keys missing from ``baseline`` are skipped.
+    tolerance : float
+        Allowed ratio of new to baseline time or peak memory.
+
+    Returns
+    -------
+    list of tuple
+        ``(key, metric, baseline, new, ratio)`` for every regression.
+    """
+    found = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if old[metric] > 0 and new[metric] > tolerance * old[metric]:
+                found.append((key, metric, old[metric], new[metric],
+                              new[metric] / old[metric]))
+    return found
+
+
+def over_budget(results, budgets=BUDGETS):
+    """Results slower than their entry in ``budgets``.
+
+    Returns
+    -------
+    list of tuple
+        ``(key, budget, seconds)`` for every result over its budget.
+    """
+    return [(key, budgets[key], new['seconds'])
+            for key, new in results.items()
+            if key in budgets and new['seconds'] > budgets[key]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m research.benchmarks',
+        description='Benchmark the lecture operations.')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES))
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES))
+    parser.add_argument('--repeats', type=int, default=_REPEATS)
+    parser.add_argument('--history', default=_HISTORY_FILE)
+    parser.add_argument('--baseline', default=_BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store this run as the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.cases, args.sizes, args.repeats, verbose=True)
+    record(results, args.history)
+    slow = over_budget(results)
+    for key, budget, seconds in slow:
+        print('OVER BUDGET %s: %.4g s > %.4g s' % (key, seconds, budget))
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        return 1 if slow else 0
+    found = regressions(results, _load(args.baseline, {}), args.tolerance)
+    for key, metric, old, new, ratio in found:
+        print('REGRESSION %s %s: %.4g -> %.4g (x%.2f)'
+              % (key, metric, old, new, ratio))
+    return 1 if found or slow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Persistent, range-merging cache in front of ``get_pricing``.
+
+The lecture scripts pull the same symbols over overlapping date ranges again
+and again. :class:`PricingCache` records which (symbol, field, date-range)
+intervals have already been loaded, serves any sub-range of a covered interval
+straight from disk, fetches only the gaps, and merges adjacent intervals into
+a single segment file. Segments are evicted least-recently-used first once the
+cache grows past its byte budget.
+
+Layout::
+
+    <root>/index.json         covered intervals and LRU bookkeeping
+    <root>/<n>.npy            one (date, value) record array per segment
+"""
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ._time import index_nanos, nanos_index, to_nanos
+from .assets import Equity
+from .store import _frame, _makedirs, get_pricing, string_types
+
+_INDEX_FILE = 'index.json'
+_RECORD_DTYPE = np.dtype([('date', '<i8'), ('value', '<f8')])
+
+
+class PricingCache(object):
+    """On-disk cache of single-field price series keyed by symbol.
+
+    Parameters
+    ----------
+    root : str
+        Directory holding the cache; created if missing.
+    loader : callable, optional
+        Called as ``loader(symbol, start_date=..., end_date=..., fields=...)``
+        for each missing range and expected to return a Series. Defaults to
+        :func:`research.store.get_pricing`.
+    max_bytes : int
+        Budget for segment files; least-recently-used segments beyond it are
+        evicted.
+    resolution : str or pd.Timedelta
+        Spacing of bar timestamps. Covered intervals closer together than this
+        are treated as contiguous, so no request is issued for the empty space
+        between consecutive daily bars.
+    """
+
+    def __init__(self, root, loader=None, max_bytes=512 * 2 ** 20,
+                 resolution='1D'):
+        _makedirs(root)
+        self.root = root
+        self.loader = get_pricing if loader is None else loader
+        self.max_bytes = max_bytes
+        self.resolution = int(pd.Timedelta(resolution).value)
+        self._lock = threading.RLock()
+        path = os.path.join(root, _INDEX_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                index = json.load(f)
+        else:
+            index = {'tick': 0, 'next_file': 0, 'entries': []}
+        self._tick = index['tick']
+        self._next_file = index['next_file']
+        self._entries = {}
+        self._assets = {}
+        for entry in index['entries']:
+            key = (entry['symbol'], entry['field'])
+            self._entries[key] = entry['segments']
+            if entry.get('sid') is not None:
+                self._assets[entry['symbol']] = Equity(entry['sid'],
+                                                       entry['symbol'])
+
+    @property
+    def nbytes(self):
+        """Total size of all cached segments."""
+        return sum(seg['nbytes']
+                   for segs in self._entries.values() for seg in segs)
+
+    def intervals(self, symbol, field):
+        """Return the covered ``(start, end)`` intervals for a key."""
+        return [(nanos_index([seg['start']])[0], nanos_index([seg['end']])[0])
+                for seg in self._entries.get((symbol, field), [])]
+
+    # Segment bookkeeping.
+
+    def _overlapping(self, key, start, end):
+        """Segments of ``key`` that overlap or abut ``[start, end]``."""
+        res = self.resolution
+        return [seg for seg in self._entries.get(key, [])
+                if seg['start'] <= end + res and seg['end'] >= start - res]
+
+    def _gaps(self, segments, start, end):
+        """Sub-ranges of ``[start, end]`` not covered by ``segments``."""
+        res = self.resolution
+        gaps = []
+        cursor = start
+        for seg in segments:
+            if seg['start'] > cursor:
+                gaps.append((cursor, seg['start'] - res))
+            cursor = max(cursor, seg['end'] + res)
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return [(lo, hi) for lo, hi in gaps if lo <= hi]
+
+    def _touch(self, segment):
+        self._tick += 1
+        segment['last_used'] = self._tick
+
+    def _read(self, segment):
+        return np.load(os.path.join(self.root, segment['file']),
+                       mmap_mode='r')
+
+    def _write(self, records, start, end):
+        name = '%d.npy' % self._next_file
+        self._next_file += 1
+        np.save(os.path.join(self.root, name), records)
+        segment = {'start': int(start), 'end': int(end), 'file': name,
+                   'nbytes': int(records.nbytes), 'last_used': 0}
+        self._touch(segment)
+        return segment
+
+    def _remove(self, key, segment):
+        self._entries[key].remove(segment)
+        if not self._entries[key]:
+            del self._entries[key]
+        try:
+            os.remove(os.path.join(self.root, segment['file']))
+        except OSError:
+            pass
+
+    def _evict(self, keep):
+        total = self.nbytes
+        if total <= self.max_bytes:
+            return
+        candidates = sorted(
+            ((seg['last_used'], key, seg)
+             for key, segs in self._entries.items() for seg in segs
+             if seg is not keep),
+            key=lambda item: item[0],
+        )
+        for _, key, seg in candidates:
+            if total <= self.max_bytes:
+                break
+            total -= seg['nbytes']
+            self._remove(key, seg)
+
+    def flush(self):
+        """Persist the interval index."""
+        with self._lock:
+            entries = []
+            for (symbol, field), segments in self._entries.items():
+                asset = self._assets.get(symbol)
+                entries.append({
+                    'symbol': symbol,
+                    'field': field,
+                    'sid': None if asset is None else asset.sid,
+                    'segments': segments,
+                })
+            path = os.path.join(self.root, _INDEX_FILE)
+            tmp = path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'tick': self._tick,
+                           'next_file': self._next_file,
+                           'entries': entries}, f)
+            os.rename(tmp, path)
+
+    def clear(self):
+        """Remove every cached segment."""
+        with self._lock:
+            for key, segments in list(self._entries.items()):
+                for seg in list(segments):
+                    self._remove(key, seg)
+            self.flush()
+
+    # Loading.
+
+    def _fetch(self, symbol, field, start, end):
+        series = self.loader(symbol,
+                             start_date=nanos_index([start])[0],
+                             end_date=nanos_index([end])[0],
+                             fields=field)
+        if isinstance(series.name, Equity):
+            self._assets.setdefault(symbol, Equity(series.name.sid, symbol))
+        records = np.empty(len(series), dtype=_RECORD_DTYPE)
+        records['date'] = index_nanos(series.index)
+        records['value'] = series.values
+        return records
+
+    def series(self, symbol, field, start_date, end_date):
+        """Return one symbol's ``field`` over ``[start_date, end_date]``.
+
+        Covered ranges are read from disk; only the uncovered gaps are passed
+        to the loader, and the result is merged into a single segment. A range
+        is covered only up to the last bar the loader returned for it.
+        """
+        start, end = to_nanos(start_date), to_nanos(end_date)
+        key = (symbol, field)
+        with self._lock:
+            segments = self._overlapping(key, start, end)
+            gaps = self._gaps(segments, start, end)
+            if not gaps and len(segments) == 1:
+                self._touch(segments[0])
+                return self._slice(self._read(segments[0]), symbol, start, end)
+
+        fetched = [self._fetch(symbol, field, lo, hi) for lo, hi in gaps]
+        fetched = [records for records in fetched if len(records)]
+
+        with self._lock:
+            segments = self._overlapping(key, start, end)
+            if not fetched and len(segments) <= 1:
+                # Nothing new, e.g. the request runs past the loader's last
+                # bar: serve what is cached without rewriting it.
+                if not segments:
+                    return self._slice(np.empty(0, dtype=_RECORD_DTYPE),
+                                       symbol, start, end)
+                self._touch(segments[0])
+                return self._slice(self._read(segments[0]), symbol, start, end)
+            parts = [np.asarray(self._read(seg)) for seg in segments] + fetched
+            records = np.concatenate(parts) if parts else \
+                np.empty(0, dtype=_RECORD_DTYPE)
+            records.sort(order='date', kind='mergesort')
+            if len(records):
+                unique = np.ones(len(records), dtype=bool)
+                unique[1:] = records['date'][1:] != records['date'][:-1]
+                records = records[unique]
+            # Coverage stops at the last bar the loader returned, so a range
+            # past the end of its data is fetched again once bars are
+            # appended.
+            lo = min([start] + [seg['start'] for seg in segments])
+            hi = max([seg['end'] for seg in segments]
+                     + [int(date) for date in records['date'][-1:]])
+            merged = self._write(records, lo, hi)
+            for seg in segments:
+                self._remove(key, seg)
+            self._entries.setdefault(key, []).append(merged)
+            self._entries[key].sort(key=lambda seg: seg['start'])
+            self._evict(keep=merged)
+            self.flush()
+        return self._slice(records, symbol, start, end)
+
+    def _slice(self, records, symbol, start, end):
+        dates = records['date']
+        lo = np.searchsorted(dates, start, side='left')
+        hi = np.searchsorted(dates, end, side='right')
+        return pd.Series(np.array(records['value'][lo:hi]),
+                         index=nanos_index(dates[lo:hi]),
+                         name=self._assets.get(symbol, symbol))
+
+    def get_pricing(self, symbols, start_date, end_date, fields='price'):
+        """Cached equivalent of ``get_pricing`` with the same return shapes.
+
+        Unlike the builtin, ``start_date`` and ``end_date`` are required since
+        they define the interval recorded in the cache.
+        """
+        single_asset = isinstance(symbols, string_types + (Equity,))
+        symbols = [symbols] if single_asset else list(symbols)
+        symbols = [getattr(s, 'symbol', s) for s in symbols]
+        single_field = isinstance(fields, string_types)
+        fields = [fields] if single_field else list(fields)
+
+        loaded = [[self.series(symbol, field, start_date, end_date)
+                   for symbol in symbols] for field in fields]
+        index = None
+        for row in loaded:
+            for series in row:
+                index = series.index if index is None \
+                    else index.union(series.index)
+        values = np.empty((len(fields), len(symbols), len(index)))
+        for i, row in enumerate(loaded):
+            for j, series in enumerate(row):
+                if len(series) == len(index):
+                    values[i, j] = series.values
+                else:
+                    values[i, j] = series.reindex(index).values
+        assets = [self._assets.get(symbol, symbol) for symbol in symbols]
+        return _frame(index, values, assets, fields, single_asset,
+                      single_field)
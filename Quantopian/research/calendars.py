@@ -0,0 +1,268 @@
+"""
+Trading calendars with precomputed position maps for fast reindexing.
+
+``Panda.py`` builds ``calendar_dates = pd.date_range(start, end, freq='D',
+tz='UTC')`` and calls ``prices.reindex(calendar_dates, method='ffill')``.
+:class:`TradingCalendar` computes the trading sessions, calendar days and
+holidays of a range once, together with the maps from each calendar day to the
+session on or before and on or after it. Reindexing a panel between the two
+axes is then a single row gather with one indexer shared by every column, and
+indexers between arbitrary axes are cached so repeated calls skip the search.
+"""
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ._time import index_nanos, nanos_index, to_nanos
+from .store import string_types
+
+METHODS = (None, 'ffill', 'bfill')
+
+_DAY_NANOS = 24 * 60 * 60 * 10 ** 9
+_MAX_INDEXERS = 64
+_indexers = OrderedDict()
+_calendars = OrderedDict()
+
+
+def _search(source, target, method):
+    """Row of ``source`` that each ``target`` label takes its value from, or
+    -1 where there is none."""
+    if method == 'ffill':
+        return np.searchsorted(source, target, side='right') - 1
+    pos = np.searchsorted(source, target, side='left')
+    found = pos < len(source)
+    if method is None:
+        found[found] = source[pos[found]] == target[found]
+    pos[~found] = -1
+    return pos
+
+
+def _cacheable(axis):
+    """Whether ``axis`` cannot change under a cached indexer."""
+    return not isinstance(axis, np.ndarray) or not axis.flags.writeable
+
+
+def indexer(source, target, method=None):
+    """Return the positions in ``source`` that realign it to ``target``.
+
+    Equivalent to ``source.get_indexer(target, method=method)`` for sorted
+    indexes. The result is cached per (source, target, method) by object
+    identity, so reindexing many frames that share an index object searches
+    only once and a hit costs nothing proportional to the index length.
+    Writeable arrays are never cached.
+    """
+    if method not in METHODS:
+        raise ValueError('unknown fill method %r' % (method,))
+    cache = _cacheable(source) and _cacheable(target)
+    key = (id(source), id(target), method)
+    if cache and key in _indexers:
+        cached_source, cached_target, positions = _indexers.pop(key)
+        if cached_source is source and cached_target is target:
+            _indexers[key] = cached_source, cached_target, positions
+            return positions
+    source_nanos = source if isinstance(source, np.ndarray) \
+        else index_nanos(source)
+    target_nanos = target if isinstance(target, np.ndarray) \
+        else index_nanos(target)
+    positions = _search(source_nanos, target_nanos, method)
+    positions.flags.writeable = False
+    if cache:
+        # The entry keeps both axes alive, so their ids cannot be reused
+        # while it is cached.
+        _indexers[key] = source, target, positions
+        while len(_indexers) > _MAX_INDEXERS:
+            _indexers.popitem(last=False)
+    return positions
+
+
+def take(values, positions):
+    """Gather rows of ``values`` at ``positions``, NaN where a position is
+    -1. Every column shares the one indexer, and the result keeps the
+    memory order of ``values`` so a frame can wrap it without a copy."""
+    values = np.asarray(values)
+    missing = positions < 0
+    any_missing = missing.any()
+    order = 'F' if values.ndim > 1 and values.flags.f_contiguous \
+        and not values.flags.c_contiguous else 'C'
+    if any_missing and values.dtype.kind not in 'fc':
+        values = values.astype(np.float64, order=order)
+    out = np.empty((len(positions),) + values.shape[1:], dtype=values.dtype,
+                   order=order)
+    # 'clip' keeps np.take from buffering the output; the -1 rows it reads
+    # are overwritten below. Column-major panels are gathered through their
+    # transpose, which np.take walks in memory order.
+    if order == 'F':
+        np.take(values.T, positions, axis=-1, out=out.T, mode='clip')
+    else:
+        np.take(values, positions, axis=0, out=out, mode='clip')
+    if any_missing:
+        out[missing] = np.nan
+    return out
+
+
+def reindex(data, index, method=None):
+    """Realign a Series or DataFrame to a sorted DatetimeIndex.
+
+    Matches ``data.reindex(index, method=method)`` but reuses cached
+    indexers and moves all columns with one gather.
+    """
+    positions = indexer(data.index, index, method)
+    if not isinstance(index, pd.DatetimeIndex):
+        index = pd.DatetimeIndex(index)
+    return _wrap(data, take(data.values, positions), index)
+
+
+def _wrap(data, out, index):
+    if isinstance(data, pd.Series):
+        return pd.Series(out, index=index, name=data.name, copy=False)
+    return pd.DataFrame(out, index=index, columns=data.columns, copy=False)
+
+
+class TradingCalendar(object):
+    """Trading sessions, calendar days and holidays over a date range.
+
+    Parameters
+    ----------
+    sessions : DatetimeIndex
+        Trading days, e.g. ``PriceStore.dates``. Times are dropped.
+    start, end : date-like, optional
+        Range of the calendar days; defaults to the first and last session.
+
+    Attributes
+    ----------
+    sessions : pd.DatetimeIndex
+        Trading days at midnight UTC.
+    days : pd.DatetimeIndex
+        Every calendar day from ``start`` to ``end`` at midnight UTC, as
+        ``pd.date_range(start, end, freq='D', tz='UTC')``.
+    holidays : pd.DatetimeIndex
+        Weekdays of ``days`` that are not sessions.
+    """
+
+    def __init__(self, sessions, start=None, end=None):
+        session_nanos = index_nanos(sessions)
+        session_nanos = np.unique(session_nanos - session_nanos % _DAY_NANOS)
+        start = session_nanos[0] if start is None else to_nanos(start)
+        end = session_nanos[-1] if end is None else to_nanos(end)
+        start -= start % _DAY_NANOS
+        session_nanos = session_nanos[(session_nanos >= start)
+                                      & (session_nanos <= end)]
+        n_days = (end - start) // _DAY_NANOS + 1
+        day_nanos = start + _DAY_NANOS * np.arange(n_days, dtype=np.int64)
+
+        self._session_nanos = session_nanos
+        self._day_nanos = day_nanos
+        self.sessions = nanos_index(session_nanos)
+        self.days = nanos_index(day_nanos)
+        is_session = np.zeros(len(day_nanos), dtype=bool)
+        self._session_days = (session_nanos - start) // _DAY_NANOS
+        is_session[self._session_days] = True
+        weekday = self.days.dayofweek < 5
+        self.holidays = self.days[weekday & ~is_session]
+
+        # Position of the session on or before / on or after each day.
+        self._day_ffill = np.cumsum(is_session) - 1
+        bfill = len(session_nanos) - np.cumsum(is_session[::-1])[::-1]
+        bfill[bfill >= len(session_nanos)] = -1
+        self._day_bfill = bfill
+        self._day_exact = np.where(is_session, self._day_ffill, -1)
+        for positions in (self._session_nanos, self._day_nanos,
+                          self._session_days, self._day_ffill,
+                          self._day_bfill, self._day_exact):
+            positions.flags.writeable = False
+
+    def __repr__(self):
+        return '%s(%d sessions, %s to %s)' % (
+            type(self).__name__, len(self.sessions),
+            self.days[0].date(), self.days[-1].date())
+
+    @classmethod
+    def from_weekdays(cls, start, end, holidays=()):
+        """Calendar whose sessions are the weekdays of ``[start, end]`` minus
+        ``holidays``."""
+        first, last = nanos_index([to_nanos(start), to_nanos(end)])
+        days = index_nanos(pd.bdate_range(first.normalize(), last))
+        closed = np.array([to_nanos(day) for day in holidays], dtype=np.int64)
+        closed -= closed % _DAY_NANOS
+        return cls(nanos_index(days[~np.isin(days, closed)]), start, end)
+
+    def is_session(self, date):
+        """Whether ``date`` is a trading day."""
+        day = to_nanos(date)
+        day -= day % _DAY_NANOS
+        pos = np.searchsorted(self._session_nanos, day)
+        return bool(pos < len(self._session_nanos)
+                    and self._session_nanos[pos] == day)
+
+    def _axis(self, axis):
+        if axis == 'sessions':
+            return self._session_nanos
+        if axis == 'days':
+            return self._day_nanos
+        raise ValueError("axis must be 'sessions' or 'days', got %r"
+                         % (axis,))
+
+    def _match(self, index):
+        """Name of the calendar axis ``index`` is equal to, if any."""
+        nanos = index_nanos(index)
+        for axis in ('sessions', 'days'):
+            own = self._axis(axis)
+            if len(nanos) == len(own) and np.array_equal(nanos, own):
+                return axis
+        return None
+
+    def indexer(self, source, target, method='ffill'):
+        """Positions in ``source`` that realign it to ``target``.
+
+        Both are ``'sessions'``, ``'days'`` or a DatetimeIndex. Between the
+        two calendar axes this is a precomputed map; otherwise it falls back
+        to the cached :func:`indexer`.
+        """
+        if method not in METHODS:
+            raise ValueError('unknown fill method %r' % (method,))
+        source_name = source if isinstance(source, string_types) \
+            else self._match(source)
+        target_name = target if isinstance(target, string_types) \
+            else self._match(target)
+        if (source_name, target_name) == ('sessions', 'days'):
+            return {'ffill': self._day_ffill, 'bfill': self._day_bfill,
+                    None: self._day_exact}[method]
+        if (source_name, target_name) == ('days', 'sessions'):
+            return self._session_days
+        if source_name is not None and source_name == target_name:
+            return np.arange(len(self._axis(source_name)))
+        source = self._axis(source_name) if source_name else source
+        target = self._axis(target_name) if target_name else target
+        return indexer(source, target, method)
+
+    def reindex(self, data, target='days', method='ffill'):
+        """Realign ``data`` to ``target`` (``'days'``, ``'sessions'`` or a
+        DatetimeIndex).
+
+        ``calendar.reindex(prices)`` is the equivalent of
+        ``prices.reindex(calendar_dates, method='ffill')``.
+        """
+        index = getattr(self, target) if isinstance(target, string_types) \
+            else pd.DatetimeIndex(target)
+        positions = self.indexer(data.index, target, method)
+        return _wrap(data, take(data.values, positions), index)
+
+
+def get_calendar(start, end, holidays=()):
+    """Return a cached weekday :class:`TradingCalendar` for ``[start, end]``.
+
+    Calendars for the same range and holidays are built once and shared.
+    """
+    key = (to_nanos(start), to_nanos(end),
+           tuple(sorted(to_nanos(day) for day in holidays)))
+    if key in _calendars:
+        _calendars[key] = _calendars.pop(key)
+        return _calendars[key]
+    calendar = TradingCalendar.from_weekdays(start, end, holidays)
+    _calendars[key] = calendar
+    while len(_calendars) > _MAX_INDEXERS:
+        _calendars.popitem(last=False)
+    return calendar
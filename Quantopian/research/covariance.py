@@ -0,0 +1,204 @@
+"""
+Covariance estimators for the portfolio variance path in ``Numpy.py``.
+
+``np.cov(returns)`` needs the full return history in memory and is recomputed
+from scratch whenever a new day arrives. :class:`OnlineCovariance` keeps the
+running mean and co-moment matrix instead, so each update costs O(N^2) and
+partial results computed on separate chunks or processes can be merged
+exactly.
+
+``np.cov`` also assumes a complete rectangular matrix: one NaN from a late
+listing poisons every entry of that asset. :func:`pairwise_cov` and
+:func:`pairwise_corr` use, for each pair, only the observations both assets
+have, counting them with masked matrix products over blocks of assets.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+_BLOCK_BYTES = 16 * 2 ** 20
+
+
+class OnlineCovariance(object):
+    """Mergeable running covariance of ``n_assets`` return series.
+
+    Observations are rows: pass ``returns.T`` for the assets-by-days layout
+    used with ``np.cov(returns)`` in ``Numpy.py``.
+
+    Parameters
+    ----------
+    n_assets : int
+        Number of series.
+
+    Notes
+    -----
+    Batches are folded in with the pairwise update of Chan, Golub and LeVeque,
+    which reduces to Welford's algorithm for a single row and keeps the
+    co-moment matrix centred, avoiding the cancellation of the naive
+    sum-of-products formula.
+    """
+
+    def __init__(self, n_assets):
+        self.n_assets = n_assets
+        self.count = 0
+        self.mean = np.zeros(n_assets)
+        self.comoment = np.zeros((n_assets, n_assets))
+
+    def update(self, rows):
+        """Add one observation of shape ``(n_assets,)`` or a batch of shape
+        ``(n_obs, n_assets)``."""
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim == 1:
+            rows = rows[np.newaxis]
+        if rows.shape[1] != self.n_assets:
+            raise ValueError('expected %d columns, got %d'
+                             % (self.n_assets, rows.shape[1]))
+        n = rows.shape[0]
+        if n == 0:
+            return self
+        mean = rows.mean(axis=0)
+        centred = rows - mean
+        self._combine(n, mean, np.dot(centred.T, centred))
+        return self
+
+    def _combine(self, n, mean, comoment):
+        total = self.count + n
+        delta = mean - self.mean
+        self.comoment += comoment
+        self.comoment += np.outer(delta, delta) * (self.count * n / total)
+        self.mean += delta * (n / total)
+        self.count = total
+
+    def merge(self, other):
+        """Fold in the state of another accumulator over the same assets."""
+        if other.n_assets != self.n_assets:
+            raise ValueError('cannot merge accumulators of different sizes')
+        if other.count:
+            self._combine(other.count, other.mean, other.comoment)
+        return self
+
+    def covariance(self, ddof=1):
+        """Return the covariance matrix, matching ``np.cov(..., ddof=ddof)``."""
+        if self.count <= ddof:
+            return np.full((self.n_assets, self.n_assets), np.nan)
+        return self.comoment / (self.count - ddof)
+
+    def portfolio_variance(self, weights, ddof=1):
+        """Return ``weights' C weights`` for the current covariance."""
+        weights = np.asarray(weights, dtype=np.float64)
+        return np.dot(np.dot(weights, self.covariance(ddof)), weights.T)
+
+    def __getstate__(self):
+        return {'n_assets': self.n_assets, 'count': self.count,
+                'mean': self.mean, 'comoment': self.comoment}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+def _isfinite(values, cols):
+    return ~np.isnan(values[:, cols])
+
+
+def _pairwise(values, ddof=1, min_periods=None, correlation=False,
+              block_size=None, valid=_isfinite):
+    """Pairwise-complete covariance or correlation of the columns of
+    ``values``, with the number of shared observations of every pair.
+
+    ``valid(values, cols)`` returns the mask of observations that count for
+    the columns ``cols``. Columns are processed in blocks of ``block_size``,
+    so the temporaries for a pair of blocks stay bounded whatever the
+    number of columns.
+    """
+    n_obs, n = values.shape
+    if block_size is None:
+        block_size = max(1, _BLOCK_BYTES // (8 * max(n_obs, 1)))
+    blocks = [np.arange(lo, min(lo + block_size, n))
+              for lo in range(0, n, block_size)]
+
+    def prepare(cols):
+        live = valid(values, cols)
+        count = live.sum(axis=0)
+        block = np.where(live, values[:, cols], 0.0)
+        # Centre on each column's own mean to limit cancellation.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shift = np.where(count > 0, block.sum(axis=0) / count, 0.0)
+        block -= shift
+        block[~live] = 0.0
+        return live.astype(np.float64), block
+
+    out = np.empty((n, n))
+    counts = np.empty((n, n), dtype=np.int64)
+    for i, rows in enumerate(blocks):
+        mask_i, x_i = prepare(rows)
+        for cols in blocks[i:]:
+            mask_j, x_j = (mask_i, x_i) if cols is rows else prepare(cols)
+            pairs = np.dot(mask_i.T, mask_j)
+            sum_i = np.dot(x_i.T, mask_j)
+            sum_j = np.dot(mask_i.T, x_j)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                comoment = np.dot(x_i.T, x_j) - sum_i * sum_j / pairs
+                if correlation:
+                    var_i = np.dot((x_i * x_i).T, mask_j) - sum_i ** 2 / pairs
+                    var_j = np.dot(mask_i.T, x_j * x_j) - sum_j ** 2 / pairs
+                    result = comoment / np.sqrt(np.maximum(var_i, 0.0)
+                                                * np.maximum(var_j, 0.0))
+                    np.clip(result, -1.0, 1.0, out=result)
+                else:
+                    result = comoment / (pairs - ddof)
+            result[pairs <= (1 if correlation else ddof)] = np.nan
+            if min_periods is not None:
+                result[pairs < min_periods] = np.nan
+            out[np.ix_(rows, cols)] = result
+            out[np.ix_(cols, rows)] = result.T
+            counts[np.ix_(rows, cols)] = pairs
+            counts[np.ix_(cols, rows)] = pairs.T
+    return out, counts
+
+
+def pairwise_cov(returns, rowvar=True, ddof=1, min_periods=None,
+                 block_size=None):
+    """Covariance matrix from pairwise-complete observations.
+
+    Each entry uses only the observations where both assets are not NaN, as
+    ``DataFrame.cov`` does, instead of letting one missing value poison a
+    whole row and column as in ``np.cov``.
+
+    Parameters
+    ----------
+    returns : np.ndarray
+        Returns with one row per asset when ``rowvar`` is True, as with
+        ``np.cov(returns)``, otherwise one row per observation.
+    ddof : int
+        Delta degrees of freedom of each pair.
+    min_periods : int, optional
+        Pairs with fewer shared observations get NaN.
+    block_size : int, optional
+        Assets per block; defaults to blocks of about 16MB of observations.
+
+    Returns
+    -------
+    cov : np.ndarray
+        ``(n_assets, n_assets)`` covariance estimate. It need not be
+        positive semi-definite when histories differ.
+    counts : np.ndarray[int64]
+        Number of observations shared by each pair; the diagonal holds each
+        asset's own count.
+    """
+    values = np.asarray(returns, dtype=np.float64)
+    if rowvar:
+        values = values.T
+    return _pairwise(values, ddof, min_periods, False, block_size)
+
+
+def pairwise_corr(returns, rowvar=True, min_periods=None, block_size=None):
+    """Correlation matrix from pairwise-complete observations.
+
+    Like ``DataFrame.corr``, each pair's means and variances are taken over
+    the observations the pair shares. Takes the arguments and returns the
+    counts of :func:`pairwise_cov`.
+    """
+    values = np.asarray(returns, dtype=np.float64)
+    if rowvar:
+        values = values.T
+    return _pairwise(values, 1, min_periods, True, block_size)
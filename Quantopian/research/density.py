@@ -0,0 +1,236 @@
+"""
+Binned density grids in place of scatter plots of return pairs.
+
+``Plotting Data.py`` draws ``plt.scatter(R_msft, R_aapl)``. Over minute data
+and hundreds of pairs that is millions of markers per figure, most of them
+drawn over each other. :func:`pair_density` bins each symbol's returns once
+and counts every requested pair into a 2D grid in one pass over the rows.
+Optionally it spreads the pairs over processes. The grids are cached, and
+:meth:`PairDensity.plot` draws one as a colour mesh, whose cost does not
+depend on the number of observations.
+"""
+from __future__ import absolute_import, division, print_function
+
+import itertools
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ._time import index_key
+
+_BLOCK_BYTES = 16 * 2 ** 20
+_MAX_CACHED = 1024
+_cache = OrderedDict()
+
+
+def _edges(values, bins, range):
+    """``(n_symbols, bins + 1)`` evenly spaced edges for every column."""
+    n_symbols = values.shape[1]
+    if range is None:
+        with np.errstate(invalid='ignore'):
+            lo, hi = np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+        lo, hi = np.nan_to_num(lo), np.nan_to_num(hi)
+    else:
+        bounds = np.broadcast_to(np.asarray(range, dtype=np.float64),
+                                 (n_symbols, 2))
+        lo, hi = bounds[:, 0], bounds[:, 1]
+    # A constant column still needs bins of some width.
+    hi = np.where(hi > lo, hi, lo + 1.0)
+    return lo[:, np.newaxis] + (hi - lo)[:, np.newaxis] * np.linspace(
+        0.0, 1.0, bins + 1)
+
+
+def _codes(values, edges, bins):
+    """Bin of every value, or -1 for NaNs and values outside the edges."""
+    lo, hi = edges[:, 0], edges[:, -1]
+    with np.errstate(invalid='ignore'):
+        scaled = (values - lo) * (bins / (hi - lo))
+        inside = (values >= lo) & (values <= hi)
+    codes = np.full(values.shape, -1, dtype=np.int32)
+    codes[inside] = np.minimum(scaled[inside].astype(np.int32), bins - 1)
+    return codes
+
+
+def _count(codes, first, second, bins, block_rows=None):
+    """``(n_pairs, bins, bins)`` counts of the column pairs
+    ``(first[p], second[p])``, with one ``bincount`` per block of rows."""
+    n_pairs = len(first)
+    cells = bins * bins
+    offsets = np.arange(n_pairs, dtype=np.int64) * cells
+    counts = np.zeros(n_pairs * cells, dtype=np.int64)
+    if block_rows is None:
+        block_rows = max(1, _BLOCK_BYTES // (8 * max(n_pairs, 1)))
+    for lo in range(0, len(codes), block_rows):
+        block = codes[lo:lo + block_rows]
+        x, y = block[:, first], block[:, second]
+        flat = x.astype(np.int64) * bins + y + offsets
+        counts += np.bincount(flat[(x >= 0) & (y >= 0)],
+                              minlength=len(counts))
+    return counts.reshape(n_pairs, bins, bins)
+
+
+def _count_parallel(codes, first, second, bins, n_jobs):
+    """:func:`_count` with the pairs split over ``n_jobs`` processes, each
+    sent only the columns its pairs use."""
+    groups = [group for group in np.array_split(np.arange(len(first)), n_jobs)
+              if len(group)]
+    with ProcessPoolExecutor(max_workers=len(groups)) as executor:
+        futures = []
+        for group in groups:
+            used, remapped = np.unique(
+                np.concatenate([first[group], second[group]]),
+                return_inverse=True)
+            futures.append(executor.submit(
+                _count, np.ascontiguousarray(codes[:, used]),
+                remapped[:len(group)], remapped[len(group):], bins))
+        return np.concatenate([future.result() for future in futures])
+
+
+class PairDensity(object):
+    """2D return histograms of pairs of symbols.
+
+    Attributes
+    ----------
+    counts : np.ndarray[int64]
+        ``(n_pairs, bins, bins)`` counts; ``counts[p, i, j]`` holds the
+        observations with the first symbol of pair ``p`` in bin ``i`` and the
+        second in bin ``j``.
+    edges : np.ndarray
+        ``(n_symbols, bins + 1)`` bin edges of every symbol.
+    pairs : list of tuple
+        Column positions of each pair.
+    labels : sequence
+        Column labels, or positions for an array input.
+    """
+
+    def __init__(self, counts, edges, pairs, labels):
+        self.counts = counts
+        self.edges = edges
+        self.pairs = pairs
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def _index(self, pair):
+        if isinstance(pair, (int, np.integer)):
+            return int(pair)
+        labels = list(self.labels)
+        positions = tuple(labels.index(label) for label in pair)
+        try:
+            return self.pairs.index(positions)
+        except ValueError:
+            raise KeyError('pair %r was not counted' % (pair,))
+
+    def grid(self, pair):
+        """``(counts, x_edges, y_edges)`` of one pair, given by its position
+        or its ``(label, label)``."""
+        p = self._index(pair)
+        i, j = self.pairs[p]
+        return self.counts[p], self.edges[i], self.edges[j]
+
+    def plot(self, pair=0, ax=None, log=True, **kwargs):
+        """Draw one pair's grid with ``pcolormesh``, first symbol on the x
+        axis. Empty cells are left blank; ``log`` uses a logarithmic colour
+        scale so sparse tails stay visible next to the dense centre."""
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import LogNorm
+
+        ax = ax or plt.gca()
+        counts, x_edges, y_edges = self.grid(pair)
+        shown = np.ma.masked_equal(counts.T, 0)
+        if log and 'norm' not in kwargs:
+            kwargs['norm'] = LogNorm()
+        return ax.pcolormesh(x_edges, y_edges, shown, **kwargs)
+
+
+def pair_density(returns, pairs=None, bins=64, range=None, n_jobs=1,
+                 block_rows=None):
+    """Count 2D histograms of many pairs of return series.
+
+    Parameters
+    ----------
+    returns : pd.DataFrame or np.ndarray
+        One row per observation and one column per symbol.
+    pairs : sequence of (a, b), optional
+        Pairs of column labels (or positions for an array). Defaults to every
+        pair of distinct columns.
+    bins : int
+        Bins per axis.
+    range : (float, float) or array_like, optional
+        Bounds shared by every symbol, or ``(n_symbols, 2)`` bounds per
+        symbol. Defaults to each symbol's own minimum and maximum. Values
+        outside the bounds are not counted, as with ``np.histogram2d``.
+    n_jobs : int
+        Processes to split the pairs over; ``-1`` uses one per CPU.
+    block_rows : int, optional
+        Rows counted at a time; defaults to about 16MB of pair codes.
+
+    Returns
+    -------
+    PairDensity
+
+    Grids are cached per pair, keyed by the values, ``bins`` and ``range``,
+    so revisiting a pair or asking for a superset of pairs counts only the
+    ones not seen before.
+    """
+    values = np.ascontiguousarray(getattr(returns, 'values', returns),
+                                  dtype=np.float64)
+    if values.ndim != 2:
+        raise ValueError('returns must have one column per symbol')
+    n_symbols = values.shape[1]
+    labels = (list(returns.columns) if isinstance(returns, pd.DataFrame)
+              else list(np.arange(n_symbols)))
+    if pairs is None:
+        positions = list(itertools.combinations(np.arange(n_symbols), 2))
+    elif isinstance(returns, pd.DataFrame):
+        positions = [(returns.columns.get_loc(a), returns.columns.get_loc(b))
+                     for a, b in pairs]
+    else:
+        positions = [(int(a), int(b)) for a, b in pairs]
+    positions = [(int(i), int(j)) for i, j in positions]
+
+    edges = _edges(values, bins, range)
+    range_key = None if range is None else \
+        np.asarray(range, dtype=np.float64).tobytes()
+    data_key = (index_key(values), values.shape, bins, range_key)
+    keys = [data_key + pair for pair in positions]
+    missing = sorted(set(pair for pair, key in zip(positions, keys)
+                         if key not in _cache))
+
+    if missing:
+        codes = _codes(values, edges, bins)
+        first = np.array([i for i, _ in missing], dtype=np.int64)
+        second = np.array([j for _, j in missing], dtype=np.int64)
+        if n_jobs == -1:
+            n_jobs = multiprocessing.cpu_count()
+        if n_jobs > 1 and len(missing) > 1:
+            counted = _count_parallel(codes, first, second, bins,
+                                      min(n_jobs, len(missing)))
+        else:
+            counted = _count(codes, first, second, bins, block_rows)
+        for pair, grid in zip(missing, counted):
+            _cache[data_key + pair] = grid
+
+    counts = np.empty((len(positions), bins, bins), dtype=np.int64)
+    for p, key in enumerate(keys):
+        _cache[key] = _cache.pop(key)
+        counts[p] = _cache[key]
+    while len(_cache) > _MAX_CACHED:
+        _cache.popitem(last=False)
+    return PairDensity(counts, edges, positions, labels)
+
+
+def scatter(x, y, bins=100, range=None, ax=None, log=True, **kwargs):
+    """Drop-in for ``plt.scatter(x, y)`` that draws the binned density.
+
+    ``range`` is ``((x_lo, x_hi), (y_lo, y_hi))``; other keywords go to
+    ``pcolormesh``. Returns the ``QuadMesh``.
+    """
+    values = np.column_stack([np.asarray(x, dtype=np.float64),
+                              np.asarray(y, dtype=np.float64)])
+    density = pair_density(values, [(0, 1)], bins, range)
+    return density.plot(0, ax=ax, log=log, **kwargs)
@@ -0,0 +1,156 @@
+"""
+Low-rank factor representation of an asset covariance matrix.
+
+``var_p = np.dot(np.dot(weights, cov_mat), weights.T)`` in ``Numpy.py`` needs
+the dense N x N matrix, which stops fitting in memory somewhere past ten
+thousand assets. :class:`FactorCovariance` stores the same information as
+
+    C = B F B' + diag(D)
+
+with N x k loadings ``B``, a k x k factor covariance ``F`` and per-asset
+specific variances ``D``, so portfolio variance, marginal risk and products
+with ``C`` cost O(N k) instead of O(N^2).
+
+The examples below check the model against ``np.cov`` and run as doctests::
+
+    python -m doctest research/factor.py
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+
+class FactorCovariance(object):
+    """Covariance matrix ``B F B' + diag(D)``.
+
+    Parameters
+    ----------
+    loadings : np.ndarray
+        Factor loadings ``B`` of shape ``(n_assets, n_factors)``.
+    factor_cov : np.ndarray
+        Factor covariance ``F`` of shape ``(n_factors, n_factors)``.
+    specific_var : np.ndarray
+        Specific (idiosyncratic) variances ``D`` of shape ``(n_assets,)``.
+
+    Examples
+    --------
+    With as many factors as assets the model reproduces the sample
+    covariance, which makes a convenient check for small universes:
+
+    >>> rng = np.random.RandomState(0)
+    >>> returns = rng.normal(0.001, 0.02, (5, 250))
+    >>> model = FactorCovariance.from_returns(returns, n_factors=len(returns))
+    >>> dense = np.cov(returns)
+    >>> np.allclose(model.to_dense(), dense)
+    True
+    >>> weights = rng.dirichlet(np.ones(5), size=3)
+    >>> np.allclose(model.batch_variance(weights),
+    ...             [np.dot(np.dot(w, dense), w) for w in weights])
+    True
+    >>> w = weights[0]
+    >>> np.allclose(model.variance(w), np.dot(np.dot(w, dense), w))
+    True
+    >>> np.allclose(model.marginal_risk(w),
+    ...             np.dot(dense, w) / np.sqrt(np.dot(np.dot(w, dense), w)))
+    True
+    """
+
+    def __init__(self, loadings, factor_cov, specific_var):
+        self.loadings = np.asarray(loadings, dtype=np.float64)
+        self.factor_cov = np.asarray(factor_cov, dtype=np.float64)
+        self.specific_var = np.asarray(specific_var, dtype=np.float64)
+        n_assets, n_factors = self.loadings.shape
+        if self.factor_cov.shape != (n_factors, n_factors):
+            raise ValueError('factor_cov must be %d x %d'
+                             % (n_factors, n_factors))
+        if self.specific_var.shape != (n_assets,):
+            raise ValueError('specific_var must have length %d' % n_assets)
+
+    @classmethod
+    def from_returns(cls, returns, n_factors, rowvar=True, ddof=1):
+        """Fit a statistical factor model by principal components.
+
+        Parameters
+        ----------
+        returns : np.ndarray
+            Asset returns, one row per asset when ``rowvar`` is True as with
+            ``np.cov(returns)``, otherwise one row per observation.
+        n_factors : int
+            Number of principal components kept as factors.
+        ddof : int
+            Delta degrees of freedom, as in ``np.cov``.
+        """
+        returns = np.asarray(returns, dtype=np.float64)
+        if rowvar:
+            returns = returns.T
+        n_obs = returns.shape[0]
+        centred = returns - returns.mean(axis=0)
+        _, singular, vt = np.linalg.svd(centred, full_matrices=False)
+        n_factors = min(n_factors, len(singular))
+        loadings = vt[:n_factors].T
+        factor_var = singular[:n_factors] ** 2 / (n_obs - ddof)
+        total_var = (centred ** 2).sum(axis=0) / (n_obs - ddof)
+        specific_var = total_var - np.dot(loadings ** 2, factor_var)
+        np.maximum(specific_var, 0.0, out=specific_var)
+        return cls(loadings, np.diag(factor_var), specific_var)
+
+    @property
+    def n_assets(self):
+        return self.loadings.shape[0]
+
+    @property
+    def n_factors(self):
+        return self.loadings.shape[1]
+
+    def dot(self, x):
+        """Return ``C x`` for a vector ``(n_assets,)`` or matrix
+        ``(n_assets, m)``."""
+        x = np.asarray(x, dtype=np.float64)
+        exposure = np.dot(self.factor_cov, np.dot(self.loadings.T, x))
+        specific = self.specific_var * x if x.ndim == 1 \
+            else self.specific_var[:, np.newaxis] * x
+        return np.dot(self.loadings, exposure) + specific
+
+    def variance(self, weights):
+        """Portfolio variance ``w' C w``."""
+        weights = np.asarray(weights, dtype=np.float64)
+        exposure = np.dot(self.loadings.T, weights)
+        return (np.dot(exposure, np.dot(self.factor_cov, exposure))
+                + np.dot(self.specific_var, weights ** 2))
+
+    def volatility(self, weights):
+        """Portfolio volatility ``sqrt(w' C w)``."""
+        return np.sqrt(self.variance(weights))
+
+    def marginal_risk(self, weights):
+        """Derivative of portfolio volatility with respect to each weight,
+        ``C w / sqrt(w' C w)``."""
+        weights = np.asarray(weights, dtype=np.float64)
+        cw = self.dot(weights)
+        return cw / np.sqrt(np.dot(weights, cw))
+
+    def batch_variance(self, weights):
+        """Variances of many portfolios.
+
+        Parameters
+        ----------
+        weights : np.ndarray
+            Weight matrix of shape ``(n_portfolios, n_assets)``.
+
+        Returns
+        -------
+        np.ndarray
+            Variance of each portfolio, shape ``(n_portfolios,)``.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        exposure = np.dot(weights, self.loadings)
+        systematic = np.einsum('pk,pk->p', np.dot(exposure, self.factor_cov),
+                               exposure)
+        return systematic + np.dot(weights ** 2, self.specific_var)
+
+    def to_dense(self):
+        """Materialise the full ``n_assets x n_assets`` matrix."""
+        dense = np.dot(np.dot(self.loadings, self.factor_cov),
+                       self.loadings.T)
+        dense[np.diag_indices_from(dense)] += self.specific_var
+        return dense
@@ -0,0 +1,167 @@
+"""
+Mergeable histogram for return distributions too large to hold in memory.
+
+``Plotting Data.py`` draws ``plt.hist(R, bins=20)`` and
+``plt.hist(R, bins=20, cumulative=True)`` from a fully materialised array of
+returns. :class:`Histogram` fixes its bin edges up front, counts chunk after
+chunk as they arrive, and adds up exactly with histograms built by other
+workers over the same edges. The counts then go to ``plt.hist`` as weights,
+so the lecture plots keep their look without the raw returns.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+
+class Histogram(object):
+    """Fixed-edge histogram accumulated over chunks.
+
+    Parameters
+    ----------
+    bins : int or array_like
+        Number of bins, or the increasing bin edges themselves.
+    range : (float, float), optional
+        Lower and upper edge when ``bins`` is a number. Required then, since
+        later chunks may fall outside the first one.
+    log : bool
+        Space the edges evenly in log space (``range`` must be positive),
+        e.g. for absolute returns or volumes spanning several decades.
+
+    Bins are closed on the left and the last bin also on the right, as in
+    ``np.histogram``. Values outside the edges are counted in
+    :attr:`underflow` and :attr:`overflow`; NaNs in :attr:`missing`.
+
+    Examples
+    --------
+    >>> hist = Histogram(20, range=(-0.1, 0.1))
+    >>> for chunk in chunks:
+    ...     hist.update(chunk)
+    >>> hist.plot(cumulative=True)   # plt.hist(R, bins=20, cumulative=True)
+    """
+
+    def __init__(self, bins=20, range=None, log=False):
+        if np.ndim(bins) == 0:
+            if range is None:
+                raise ValueError('range is required with a number of bins')
+            lo, hi = float(range[0]), float(range[1])
+            if not hi > lo:
+                raise ValueError('range must be increasing')
+            if log:
+                if lo <= 0:
+                    raise ValueError('log bins need a positive range')
+                edges = np.geomspace(lo, hi, int(bins) + 1)
+            else:
+                edges = np.linspace(lo, hi, int(bins) + 1)
+            self._uniform = not log
+            self._log = log
+        else:
+            edges = np.asarray(bins, dtype=np.float64)
+            if edges.ndim != 1 or len(edges) < 2 or \
+                    not (np.diff(edges) > 0).all():
+                raise ValueError('bin edges must increase')
+            self._uniform = self._log = False
+        self.edges = edges
+        self.counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.missing = 0
+
+    @property
+    def n_bins(self):
+        return len(self.counts)
+
+    @property
+    def total(self):
+        """Number of values counted inside the edges."""
+        return int(self.counts.sum())
+
+    def _bin_index(self, values):
+        """Bin of every in-range value, matching ``np.histogram``."""
+        n = self.n_bins
+        lo, hi = self.edges[0], self.edges[-1]
+        if self._uniform or self._log:
+            if self._log:
+                scaled = (np.log(values) - np.log(lo)) / (np.log(hi)
+                                                         - np.log(lo))
+            else:
+                scaled = (values - lo) / (hi - lo)
+            index = np.minimum((scaled * n).astype(np.int64), n - 1)
+            # The arithmetic can land one bin off next to an edge.
+            index -= values < self.edges[index]
+            index += (values >= self.edges[index + 1]) & (index < n - 1)
+            return index
+        return np.minimum(np.searchsorted(self.edges, values, side='right')
+                          - 1, n - 1)
+
+    def update(self, values):
+        """Count a chunk of values (any shape)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        lo, hi = self.edges[0], self.edges[-1]
+        # NaN fails both comparisons, so what is neither inside nor below
+        # nor above is missing.
+        keep = (values >= lo) & (values <= hi)
+        inside = values[keep]
+        below = int(np.count_nonzero(values < lo))
+        above = int(np.count_nonzero(values > hi))
+        self.underflow += below
+        self.overflow += above
+        self.missing += len(values) - len(inside) - below - above
+        if len(inside):
+            self.counts += np.bincount(self._bin_index(inside),
+                                       minlength=self.n_bins)
+        return self
+
+    def merge(self, other):
+        """Add the counts of a histogram with the same edges."""
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError('cannot merge histograms with different edges')
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.missing += other.missing
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        out = Histogram(self.edges)
+        out._uniform, out._log = self._uniform, self._log
+        return out.merge(self).merge(other)
+
+    def density(self):
+        """Probability density of each bin, integrating to one over the
+        edges, as ``np.histogram(..., density=True)``."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.counts / (self.total * np.diff(self.edges))
+
+    def cumulative(self, normed=False):
+        """Running count up to the right edge of each bin, or the empirical
+        CDF at the right edges when ``normed``. Underflow is included."""
+        running = np.cumsum(self.counts) + self.underflow
+        if normed:
+            return running / float(self.total + self.underflow
+                                   + self.overflow)
+        return running
+
+    def plot(self, ax=None, **kwargs):
+        """Draw with ``hist`` as if the raw values had been passed.
+
+        Keywords such as ``cumulative=True``, ``density=True`` or
+        ``color`` are forwarded to ``ax.hist``; the counts are passed as
+        weights of one value per bin.
+        """
+        if ax is None:
+            import matplotlib.pyplot as plt
+            ax = plt.gca()
+        centres = 0.5 * (self.edges[:-1] + self.edges[1:])
+        return ax.hist(centres, bins=self.edges, weights=self.counts,
+                       **kwargs)
+
+
+def histogram(chunks, bins=20, range=None, log=False):
+    """Accumulate a :class:`Histogram` over an iterable of chunks."""
+    hist = Histogram(bins, range, log)
+    for chunk in chunks:
+        hist.update(chunk)
+    return hist
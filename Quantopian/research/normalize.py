@@ -0,0 +1,198 @@
+"""
+Z-score normalisation of return panels in bounded memory.
+
+``Panda.py`` normalises with ``(mult_returns - mult_returns.mean(axis=0)) /
+mult_returns.std(axis=0)``, which makes several temporaries the size of the
+panel. :func:`zscore` normalises per symbol over time (``axis=0``) or per day
+across symbols (``axis=1``) a block of rows at a time, writing into a
+preallocated output or back into the input, so the extra memory is one block
+whatever the size of the panel. :class:`ZScorer` keeps the per-symbol
+statistics so rows appended later can be normalised on their own.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pandas as pd
+
+_BLOCK_BYTES = 4 * 2 ** 20
+
+
+def _values(data, row=False):
+    """Float ``(rows, columns)`` view of ``data``, without casting float32.
+
+    A 1-d input is a single column, or a single row if ``row`` is True.
+    """
+    values = np.asarray(getattr(data, 'values', data))
+    if values.dtype.kind != 'f':
+        values = values.astype(np.float64)
+    if values.ndim == 1:
+        return values[np.newaxis] if row else values[:, np.newaxis]
+    return values
+
+
+def _row_blocks(n_rows, n_cols, start=0, block_rows=None):
+    if block_rows is None:
+        block_rows = max(1, _BLOCK_BYTES // (8 * max(n_cols, 1)))
+    for lo in range(start, n_rows, block_rows):
+        yield slice(lo, min(lo + block_rows, n_rows))
+
+
+def _standardise(block, mean, std, out):
+    """Write ``(block - mean) / std`` into ``out``; NaNs stay NaN."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.subtract(block, mean, out=out, casting='unsafe')
+        np.divide(out, std, out=out, casting='unsafe')
+
+
+class ZScorer(object):
+    """Running per-symbol mean and standard deviation for normalising rows.
+
+    Statistics are NaN-aware and updated with the pairwise (Chan) merge used
+    by :class:`research.covariance.OnlineCovariance`, so feeding the history
+    in blocks gives the same result as one pass over all of it.
+
+    Parameters
+    ----------
+    n_symbols : int
+        Number of columns.
+    ddof : int
+        Delta degrees of freedom of the standard deviation.
+
+    Examples
+    --------
+    Fit on the history, then normalise each day's new rows in place:
+
+    >>> scorer = ZScorer.from_history(returns)
+    >>> scorer.update(new_rows).transform(new_rows, out=new_rows)
+    """
+
+    def __init__(self, n_symbols, ddof=1):
+        self.n_symbols = n_symbols
+        self.ddof = ddof
+        self.count = np.zeros(n_symbols)
+        self._mean = np.zeros(n_symbols)
+        self._m2 = np.zeros(n_symbols)
+
+    @classmethod
+    def from_history(cls, data, ddof=1, block_rows=None):
+        """Create a scorer fitted to every row of ``data``."""
+        values = _values(data)
+        scorer = cls(values.shape[1], ddof)
+        for rows in _row_blocks(len(values), values.shape[1],
+                                block_rows=block_rows):
+            scorer.update(values[rows])
+        return scorer
+
+    def update(self, rows):
+        """Fold one row or a block of rows into the statistics."""
+        block = _values(rows, row=True)
+        if block.shape[1] != self.n_symbols:
+            raise ValueError('expected %d columns, got %d'
+                             % (self.n_symbols, block.shape[1]))
+        valid = ~np.isnan(block)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid, block, 0.0).sum(axis=0) / count
+            dev = np.where(valid, block - mean, 0.0)
+            m2 = np.einsum('ij,ij->j', dev, dev)
+            total = self.count + count
+            delta = np.where(count > 0, mean - self._mean, 0.0)
+            self._m2 += m2 + delta * delta * (self.count * count / total)
+            self._mean += np.where(count > 0, delta * (count / total), 0.0)
+        self._m2 = np.nan_to_num(self._m2)
+        self.count = total
+        return self
+
+    @property
+    def mean(self):
+        """Mean of each symbol so far."""
+        out = self._mean.copy()
+        out[self.count == 0] = np.nan
+        return out
+
+    @property
+    def std(self):
+        """Standard deviation of each symbol so far."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = np.sqrt(np.maximum(self._m2, 0.0) / (self.count - self.ddof))
+        out[self.count <= self.ddof] = np.nan
+        return out
+
+    def transform(self, rows, out=None):
+        """Normalise ``rows`` with the current statistics, into ``out`` (which
+        may be ``rows`` itself) or a new array."""
+        block = _values(rows, row=True)
+        if out is None:
+            out = np.empty(np.shape(rows), dtype=block.dtype)
+        _standardise(block, self.mean, self.std, out.reshape(block.shape))
+        return out
+
+
+def zscore(data, axis=0, ddof=1, out=None, start=0, block_rows=None):
+    """Z-score a panel a block of rows at a time.
+
+    Equivalent to ``(data - data.mean(axis)) / data.std(axis, ddof=ddof)``
+    with NaNs skipped, as pandas does, but with temporaries no larger than
+    one block.
+
+    Parameters
+    ----------
+    data : pd.Series, pd.DataFrame or np.ndarray
+        Panel with one row per date and one column per symbol. float32 input
+        is kept as float32; statistics are accumulated in float64.
+    axis : {0, 1}
+        0 normalises each symbol over time (two passes: statistics, then
+        output); 1 normalises each date across symbols (one pass).
+    ddof : int
+        Delta degrees of freedom of the standard deviation.
+    out : np.ndarray, optional
+        Preallocated output of the shape of ``data``. Pass the input array
+        (e.g. a writable ``np.memmap``) to normalise in place.
+    start : int
+        Only write rows from ``start`` on, e.g. the rows appended since the
+        last run. Rows before it are left as they are in ``out``. With
+        ``axis=0`` the statistics still use every row.
+    block_rows : int, optional
+        Rows per block; defaults to blocks of about 4MB.
+
+    Returns
+    -------
+    Same type as ``data``
+        The normalised panel, sharing memory with ``out`` when given.
+    """
+    if axis not in (0, 1):
+        raise ValueError('axis must be 0 or 1')
+    values = _values(data)
+    if out is None:
+        out = np.empty(np.shape(getattr(data, 'values', data)),
+                       dtype=values.dtype)
+    target = out[:, np.newaxis] if out.ndim == 1 else out
+    if target.shape != values.shape:
+        raise ValueError('out must have shape %s' % (values.shape,))
+    n_rows, n_cols = values.shape
+
+    if axis == 0:
+        scorer = ZScorer.from_history(values, ddof, block_rows)
+        mean, std = scorer.mean, scorer.std
+        for rows in _row_blocks(n_rows, n_cols, start, block_rows):
+            _standardise(values[rows], mean, std, target[rows])
+    else:
+        for rows in _row_blocks(n_rows, n_cols, start, block_rows):
+            block = values[rows]
+            valid = ~np.isnan(block)
+            count = valid.sum(axis=1)[:, np.newaxis]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(valid, block, 0.0).sum(axis=1,
+                                                       keepdims=True) / count
+                dev = np.where(valid, block - mean, 0.0)
+                std = np.sqrt(np.einsum('ij,ij->i', dev, dev)[:, np.newaxis]
+                              / (count - ddof))
+            std[count <= ddof] = np.nan
+            _standardise(block, mean, std, target[rows])
+
+    if isinstance(data, pd.Series):
+        return pd.Series(out, index=data.index, name=data.name, copy=False)
+    if isinstance(data, pd.DataFrame):
+        return pd.DataFrame(out, index=data.index, columns=data.columns,
+                            copy=False)
+    return out
@@ -0,0 +1,494 @@
+"""
+Mean-variance portfolio optimisation on top of ``mean_returns`` and
+``cov_mat`` from ``Numpy.py``.
+
+:class:`MeanVarianceOptimizer` finds minimum-variance, maximum-Sharpe and
+efficient-frontier portfolios, either long-short (closed form) or long-only
+(primal active-set method). Long-only solves start from the previous solution
+of the same kind, so re-optimising after a daily
+:meth:`~MeanVarianceOptimizer.update` only has to add or drop the few names
+whose constraints changed.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+# Block size of the triangular solves.
+_BLOCK = 64
+
+# Dropping a name downdates the factor below it at a cost that grows with the
+# number of free names after it; once those tails add up to this many times
+# the free set, refactorising the block after the first dropped name is
+# cheaper.
+_REFACTOR = 2
+
+
+def _solve_lower(l, rhs):
+    """Solve ``l y = rhs`` for lower-triangular ``l`` by blocked forward
+    substitution, O(n^2) rather than the O(n^3) of a general solve."""
+    y = np.array(rhs, dtype=np.float64)
+    for start in range(0, len(l), _BLOCK):
+        stop = min(start + _BLOCK, len(l))
+        if start:
+            y[start:stop] -= np.dot(l[start:stop, :start], y[:start])
+        y[start:stop] = np.linalg.solve(l[start:stop, start:stop],
+                                        y[start:stop])
+    return y
+
+
+def _solve_upper(l, rhs):
+    """Solve ``l' z = rhs`` for lower-triangular ``l``."""
+    z = np.array(rhs, dtype=np.float64)
+    n = len(l)
+    for stop in range(n, 0, -_BLOCK):
+        start = max(stop - _BLOCK, 0)
+        if stop < n:
+            z[start:stop] -= np.dot(l[stop:, start:stop].T, z[stop:])
+        z[start:stop] = np.linalg.solve(l[start:stop, start:stop].T,
+                                        z[start:stop])
+    return z
+
+
+def _update(l, x):
+    """Overwrite lower-triangular ``l`` with the Cholesky factor of
+    ``l l' + x x'``.
+
+    With ``p = l^-1 x`` and ``b[k] = 1 + p[:k] . p[:k]``, the factor is
+    ``l m`` for the Cholesky factor ``m`` of ``I + p p'``, which has
+    ``m[k, k] = sqrt(b[k + 1] / b[k])`` and
+    ``m[i, k] = p[i] p[k] / sqrt(b[k] b[k + 1])`` below the diagonal. Column
+    ``k`` of ``l m`` only needs the suffix sum of ``l[:, i] p[i]`` over
+    ``i > k``, so the whole update is one triangular solve and a few array
+    operations, O(n^2) without a Python-level loop over the columns.
+    """
+    p = _solve_lower(l, x)
+    b = np.empty(len(p) + 1)
+    b[0] = 1.0
+    np.cumsum(p * p, out=b[1:])
+    b[1:] += 1.0
+    weighted = l * p
+    # Zeros above the diagonal of l keep the suffix sums exactly zero there.
+    suffix = np.cumsum(weighted[:, :0:-1], axis=1)[:, ::-1]
+    l *= np.sqrt(b[1:] / b[:-1])
+    suffix *= p[:-1] / np.sqrt(b[:-2] * b[1:-1])
+    l[:, :-1] += suffix
+
+
+class _CholeskyFree(object):
+    """Cholesky factor ``L L' = Q[free, free]`` of a dense quadratic, updated
+    in O(|free|^2) per variable as variables enter and leave the free set.
+
+    Parameters
+    ----------
+    block : callable
+        ``block(rows, cols)`` returns ``Q[rows][:, cols]``; its diagonal
+        entries are not used.
+    diagonal : np.ndarray
+        Diagonal of ``Q``.
+    """
+
+    def __init__(self, block, diagonal):
+        self._block = block
+        self._diagonal = diagonal
+        self._l = np.zeros((_BLOCK, _BLOCK))
+        self.free = []
+
+    def add(self, indices):
+        n, m = len(self.free), len(indices)
+        if not m:
+            return
+        if n + m > len(self._l):
+            size = max(2 * len(self._l), n + m)
+            grown = np.zeros((size, size))
+            grown[:n, :n] = self._l[:n, :n]
+            self._l = grown
+        schur = self._block(indices, indices)
+        schur[np.diag_indices(m)] = self._diagonal[indices]
+        if n:
+            rows = _solve_lower(self._l[:n, :n],
+                                self._block(self.free, indices)).T
+            schur -= np.dot(rows, rows.T)
+        try:
+            corner = np.linalg.cholesky(schur)
+        except np.linalg.LinAlgError:
+            # A singular free block (e.g. a sample covariance of fewer
+            # observations than assets): add one at a time, flooring each
+            # pivot at a relative jitter.
+            for j in indices:
+                self.add_one(j)
+            return
+        if n:
+            self._l[n:n + m, :n] = rows
+        self._l[n:n + m, n:n + m] = corner
+        self.free.extend(indices)
+
+    def add_one(self, j):
+        n = len(self.free)
+        pivot = self._diagonal[j]
+        if n:
+            row = _solve_lower(self._l[:n, :n],
+                               self._block(self.free, [j])[:, 0])
+            self._l[n, :n] = row
+            pivot -= np.dot(row, row)
+        floor = 1e-12 * max(self._diagonal[j], 1e-300)
+        self._l[n, n] = np.sqrt(max(pivot, floor))
+        self.free.append(j)
+
+    def drop(self, positions):
+        n = len(self.free)
+        positions = np.sort(positions)[::-1]
+        # Each downdate works on the names after the dropped one that are
+        # still free at that point.
+        tails = n - 1 - positions - np.arange(len(positions))
+        if tails.sum() > _REFACTOR * n:
+            # Refactorise everything after the first dropped name with one
+            # block step; the factor before it is unchanged.
+            first, dropped = positions[-1], set(positions)
+            rest = [j for pos, j in enumerate(self.free[first:], first)
+                    if pos not in dropped]
+            self._l[first:n] = 0.0
+            del self.free[first:]
+            self.add(rest)
+            return
+        for pos in positions:
+            self.drop_one(pos)
+
+    def drop_one(self, pos):
+        n = len(self.free)
+        l = self._l
+        tail = l[pos + 1:n, pos].copy()
+        l[pos:n - 1, :n] = l[pos + 1:n, :n]
+        l[:n - 1, pos:n - 1] = l[:n - 1, pos + 1:n]
+        l[n - 1, :n] = 0.0
+        l[:n, n - 1] = 0.0
+        # The trailing block absorbs the dropped column as a rank-one update.
+        if len(tail):
+            _update(l[pos:n - 1, pos:n - 1], tail)
+        del self.free[pos]
+
+    def solve(self, rhs):
+        n = len(self.free)
+        l = self._l[:n, :n]
+        return _solve_upper(l, _solve_lower(l, rhs))
+
+
+class _WoodburyFree(object):
+    """Solves with the free block of ``B F B' + diag(s)`` through the
+    Woodbury identity, O(|free| k^2) without forming any N x |free| block.
+    Requires ``s > 0``."""
+
+    def __init__(self, loadings, factor_cov, specific):
+        self._loadings = loadings
+        self._factor_cov = factor_cov
+        self._specific = specific
+        self.free = []
+
+    def add(self, indices):
+        self.free.extend(indices)
+
+    def drop(self, positions):
+        dropped = set(positions)
+        self.free = [j for pos, j in enumerate(self.free) if pos not in dropped]
+
+    def solve(self, rhs):
+        # (S + B F B')^-1 = S^-1 - S^-1 B (I + F B' S^-1 B)^-1 F B' S^-1
+        b = self._loadings[self.free]
+        specific = self._specific[self.free]
+        scaled = rhs / specific[:, np.newaxis]
+        b_scaled = b / specific[:, np.newaxis]
+        inner = np.eye(b.shape[1]) + np.dot(self._factor_cov,
+                                            np.dot(b.T, b_scaled))
+        exposure = np.dot(self._factor_cov, np.dot(b.T, scaled))
+        return scaled - np.dot(b_scaled, np.linalg.solve(inner, exposure))
+
+
+def _active_set(system, matvec, a, b, c, x, tol, max_iter):
+    """Minimise ``x'Qx / 2 + c'x`` subject to ``a'x = b`` and ``x >= 0``.
+
+    Parameters
+    ----------
+    system : _CholeskyFree or _WoodburyFree
+        Solver for ``Q[free, free]``, initially with an empty free set.
+    matvec : callable
+        ``matvec(x)`` returns ``Q x``.
+    x : np.ndarray
+        Feasible starting point; its support is the initial free set.
+
+    Notes
+    -----
+    Each iteration solves the equality-constrained problem on the free
+    variables. If that solution is non-negative, the variables with the most
+    negative reduced gradients are freed; otherwise the step is cut back at
+    the first variable to hit zero, which is then fixed. The number freed at
+    once doubles while the objective keeps falling and drops back to one
+    when it stalls. ``system`` is updated rather than refactorised, so an
+    iteration costs one ``matvec`` plus O(|free|^2) for a dense ``Q`` or
+    O(|free| k^2) for a factor model.
+
+    A warm start usually holds a few names that have to go. Until the first
+    non-negative solution, every negative variable is fixed at once and the
+    rest rescaled onto ``a'x = b``, instead of cutting the step back one
+    variable per iteration; the iterations after that start from this
+    feasible point as usual.
+    """
+    system.add(list(np.flatnonzero(x > 0)))
+    batch, best = 1, np.inf
+    crash = len(system.free) > 1
+    for _ in range(max_iter):
+        free = np.asarray(system.free)
+        sol = system.solve(np.column_stack([a[free], c[free]]))
+        qa, qc = sol[:, 0], sol[:, 1]
+        nu = (b + np.dot(a[free], qc)) / np.dot(a[free], qa)
+        candidate = nu * qa - qc
+        current = x[free]
+        if crash:
+            keep = candidate > 0
+            kept = np.dot(a[free[keep]], candidate[keep])
+            crash = not keep.all() and kept > 0
+        if crash:
+            x = np.zeros_like(x)
+            x[free[keep]] = candidate[keep] * (b / kept)
+            system.drop(np.flatnonzero(~keep))
+        elif (candidate >= 0).all():
+            x = np.zeros_like(x)
+            x[free] = candidate
+            qx = matvec(x)
+            reduced = qx + c - nu * a
+            reduced[free] = 0.0
+            entering = np.flatnonzero(
+                reduced < -tol * max(1.0, np.abs(nu * a).max()))
+            if not len(entering):
+                return x
+            objective = 0.5 * np.dot(x, qx) + np.dot(c, x)
+            if objective < best - 1e-12 * abs(objective):
+                batch, best = 2 * batch, objective
+            else:
+                batch = 1
+            order = np.argsort(reduced[entering])[:batch]
+            system.add(list(entering[order]))
+        else:
+            step = candidate - current
+            blocking = np.flatnonzero(step < 0)
+            ratios = current[blocking] / -step[blocking]
+            k = np.argmin(ratios)
+            current = current + min(ratios[k], 1.0) * step
+            current[blocking[k]] = 0.0
+            x = np.zeros_like(x)
+            x[free] = np.maximum(current, 0.0)
+            system.drop(np.flatnonzero(current <= 0))
+    return x
+
+
+class MeanVarianceOptimizer(object):
+    """Markowitz optimiser with warm starts.
+
+    Parameters
+    ----------
+    mean_returns : array_like
+        Expected return of each asset, shape ``(n_assets,)``.
+    cov : np.ndarray or FactorCovariance
+        Dense covariance matrix or a
+        :class:`research.factor.FactorCovariance`.
+    long_only : bool
+        Constrain weights to be non-negative. All portfolios are fully
+        invested (weights sum to one).
+    ridge : float
+        Added to the diagonal of ``cov``; needed for long-short solves when
+        the sample covariance is singular (fewer observations than assets).
+    tol : float
+        Optimality tolerance of the long-only solver.
+    max_iter : int
+        Iteration cap of the long-only solver.
+    """
+
+    def __init__(self, mean_returns, cov, long_only=True, ridge=0.0,
+                 tol=1e-10, max_iter=10000):
+        self.long_only = long_only
+        self.ridge = ridge
+        self.tol = tol
+        self.max_iter = max_iter
+        self._warm = {}
+        self._inverse = None
+        self._diagonal = None
+        self.update(mean_returns, cov)
+
+    def update(self, mean_returns=None, cov=None):
+        """Replace the inputs, e.g. after a new day of data, keeping the
+        previous solutions as starting points."""
+        if mean_returns is not None:
+            self.mean_returns = np.asarray(mean_returns, dtype=np.float64)
+            self._inverse = None
+        if cov is not None:
+            if isinstance(cov, np.ndarray) or not hasattr(cov, 'loadings'):
+                cov = np.asarray(cov, dtype=np.float64)
+            self.cov = cov
+            self._inverse = None
+            self._diagonal = None
+        return self
+
+    @property
+    def n_assets(self):
+        return len(self.mean_returns)
+
+    # Linear algebra on the (possibly implicit) covariance.
+
+    def _free_system(self):
+        """Solver for free blocks of ``C`` including the ridge; see
+        :func:`_active_set`."""
+        if isinstance(self.cov, np.ndarray):
+            cov = self.cov
+
+            def block(rows, cols):
+                return cov[np.ix_(rows, cols)]
+        else:
+            loadings, factor_cov = self.cov.loadings, self.cov.factor_cov
+            specific = self.cov.specific_var + self.ridge
+            if (specific > 0).all():
+                return _WoodburyFree(loadings, factor_cov, specific)
+
+            def block(rows, cols):
+                return np.dot(np.dot(loadings[rows], factor_cov),
+                              loadings[cols].T)
+        return _CholeskyFree(block, self._diag())
+
+    def _matvec(self, x):
+        out = self.cov.dot(x)
+        if self.ridge:
+            out = out + self.ridge * x
+        return out
+
+    def _diag(self):
+        if self._diagonal is None:
+            if isinstance(self.cov, np.ndarray):
+                diagonal = np.diag(self.cov).copy()
+            else:
+                exposure = np.dot(self.cov.loadings, self.cov.factor_cov)
+                diagonal = (np.einsum('ik,ik->i', exposure, self.cov.loadings)
+                            + self.cov.specific_var)
+            self._diagonal = diagonal + self.ridge
+        return self._diagonal
+
+    def _inverse_products(self):
+        """Return ``C^-1 1`` and ``C^-1 mu`` as the columns of one array."""
+        if self._inverse is None:
+            rhs = np.column_stack([np.ones(self.n_assets), self.mean_returns])
+            if isinstance(self.cov, np.ndarray):
+                cov = self.cov
+                if self.ridge:
+                    cov = cov + self.ridge * np.eye(self.n_assets)
+                self._inverse = np.linalg.solve(cov, rhs)
+            else:
+                # Woodbury identity: O(N k^2) instead of a dense solve.
+                specific = self.cov.specific_var + self.ridge
+                if (specific <= 0).any():
+                    raise ValueError('specific variances must be positive; '
+                                     'pass a ridge')
+                b = self.cov.loadings
+                d_rhs = rhs / specific[:, np.newaxis]
+                inner = (np.linalg.inv(self.cov.factor_cov)
+                         + np.dot(b.T / specific, b))
+                correction = np.dot(b, np.linalg.solve(inner,
+                                                       np.dot(b.T, d_rhs)))
+                self._inverse = d_rhs - correction / specific[:, np.newaxis]
+        return self._inverse
+
+    def _long_only(self, key, a, c, risk_aversion=1.0):
+        """Solve the long-only problem ``min g/2 w'Cw + c'w, a'w = 1``,
+        starting from the previous solution stored under ``key``."""
+        x = self._warm.get(key)
+        if x is not None and len(x) == self.n_assets:
+            scale = np.dot(a, x)
+            x = x / scale if scale > 0 else None
+        if x is None or len(x) != self.n_assets:
+            # Cold start from the best single-asset portfolio.
+            candidates = np.flatnonzero(a > 0)
+            scaled = 1.0 / a[candidates]
+            objective = (0.5 * risk_aversion * self._diag()[candidates]
+                         * scaled ** 2 + c[candidates] * scaled)
+            j = candidates[np.argmin(objective)]
+            x = np.zeros(self.n_assets)
+            x[j] = 1.0 / a[j]
+
+        # Dividing c by the risk aversion leaves the minimiser unchanged.
+        x = _active_set(self._free_system(), self._matvec, a, 1.0,
+                        c / risk_aversion, x, self.tol, self.max_iter)
+        self._warm[key] = x
+        return x
+
+    # Portfolios.
+
+    def min_variance(self):
+        """Fully invested portfolio with the lowest variance."""
+        if not self.long_only:
+            x = self._inverse_products()[:, 0]
+            return x / x.sum()
+        ones = np.ones(self.n_assets)
+        return self._long_only('min_variance', ones, np.zeros(self.n_assets))
+
+    def max_sharpe(self, risk_free=0.0):
+        """Fully invested portfolio with the highest Sharpe ratio.
+
+        Raises ``ValueError`` when no asset has an expected return above
+        ``risk_free`` in the long-only case.
+        """
+        excess = self.mean_returns - risk_free
+        if not self.long_only:
+            inv = self._inverse_products()
+            x = inv[:, 1] - risk_free * inv[:, 0]
+            return x / x.sum()
+        if not (excess > 0).any():
+            raise ValueError('no asset has a positive excess return')
+        # Maximising the Sharpe ratio is equivalent to minimising y'Cy over
+        # {y >= 0, excess'y = 1} and rescaling y to sum to one.
+        y = self._long_only(('max_sharpe', risk_free), excess,
+                            np.zeros(self.n_assets))
+        return y / y.sum()
+
+    def efficient_portfolio(self, risk_aversion, key=None):
+        """Maximise ``mu'w - risk_aversion / 2 * w'Cw`` over fully invested
+        portfolios."""
+        if not self.long_only:
+            inv = self._inverse_products()
+            w = inv[:, 1] / risk_aversion
+            return w + (1.0 - w.sum()) / inv[:, 0].sum() * inv[:, 0]
+        key = ('efficient', risk_aversion) if key is None else key
+        return self._long_only(key, np.ones(self.n_assets),
+                               -self.mean_returns, risk_aversion)
+
+    def frontier(self, n_points=20, risk_aversion=None):
+        """Trace the efficient frontier.
+
+        Parameters
+        ----------
+        n_points : int
+            Number of portfolios when ``risk_aversion`` is not given.
+        risk_aversion : array_like, optional
+            Risk-aversion coefficients to solve for. Defaults to a geometric
+            grid, scaled to the inputs, running from close to the
+            maximum-return portfolio to close to the minimum-variance one.
+
+        Returns
+        -------
+        expected : np.ndarray
+            Expected return of each frontier portfolio.
+        volatility : np.ndarray
+            Volatility of each frontier portfolio.
+        weights : np.ndarray
+            Weights, shape ``(n_points, n_assets)``.
+        """
+        if risk_aversion is None:
+            spread = np.ptp(self.mean_returns) or 1.0
+            scale = spread / np.mean(self._diag())
+            risk_aversion = scale * np.logspace(-2, 3, n_points)
+        risk_aversion = np.asarray(risk_aversion, dtype=np.float64)
+        weights = np.empty((len(risk_aversion), self.n_assets))
+        for i, gamma in enumerate(risk_aversion):
+            # Each point starts from its own solution of the previous update,
+            # or on the first pass from its neighbour along the curve.
+            key = ('frontier', i)
+            if i and key not in self._warm:
+                self._warm[key] = weights[i - 1]
+            weights[i] = self.efficient_portfolio(gamma, key=key)
+        expected = np.dot(weights, self.mean_returns)
+        variance = np.einsum('ij,ji->i', weights, self._matvec(weights.T))
+        return expected, np.sqrt(np.maximum(variance, 0.0)), weights
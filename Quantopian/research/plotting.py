@@ -0,0 +1,222 @@
+"""
+Line plots of long series, reduced to what the screen can show.
+
+``Plotting Data.py`` calls ``plt.plot(data['MSFT'])`` on the raw series; with
+years of minute bars that is millions of vertices per line, almost all of
+which land on the same pixel columns. :func:`plot` takes the same arguments
+as ``plt.plot`` but draws a shape-preserving reduction of each line to about
+two points per pixel column, either the minimum and maximum of every bucket
+or the Largest-Triangle-Three-Buckets selection. Zooming re-reduces only the
+visible range, and reductions are cached per range.
+"""
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ._time import index_key, index_nanos
+
+METHODS = ('minmax', 'lttb')
+
+_DAY_NANOS = 24 * 60 * 60 * 10 ** 9
+_MAX_CACHED = 256
+_cache = OrderedDict()
+
+
+def _minmax(y, n_out):
+    """Positions of the minimum and maximum of ``n_out // 2`` equal-count
+    buckets, in order, plus the end points."""
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    # Pad the last bucket with its final value, which leaves its extremes
+    # unchanged; NaNs never win either comparison.
+    padded = np.empty(n_buckets * size)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    low = np.where(np.isnan(padded), np.inf, padded).reshape(n_buckets, size)
+    high = np.where(np.isnan(padded), -np.inf, padded).reshape(n_buckets,
+                                                                  size)
+    offsets = np.arange(n_buckets) * size
+    lo = offsets + low.argmin(axis=1)
+    hi = offsets + high.argmax(axis=1)
+    picked = np.concatenate([[0], np.minimum(lo, hi), np.maximum(lo, hi),
+                             [n - 1]])
+    return np.unique(np.minimum(picked, n - 1))
+
+
+def _lttb(x, y, n_out):
+    """Positions chosen by Largest-Triangle-Three-Buckets."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # Interior points split into n_out - 2 buckets; the averages of every
+    # bucket are computed up front, the selection itself is sequential.
+    edges = (np.arange(n_out - 1) * (n - 2) // (n_out - 2) + 1).astype(
+        np.int64)
+    edges[-1] = n - 1
+    y_filled = np.where(np.isnan(y), 0.0, y)
+    counts = np.maximum(np.diff(edges), 1)
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y_filled[:n - 1], edges[:-1]) / counts
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y_filled[-1])
+
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y_filled[a]
+        area = np.abs((ax - mean_x[i]) * (y_filled[lo:hi] - ay)
+                      - (ax - x[lo:hi]) * (mean_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def downsample(x, y, n_out, method='minmax'):
+    """Positions of the points of ``(x, y)`` to draw at ``n_out`` points.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Numeric, increasing x coordinates (e.g. int64 nanoseconds).
+    y : np.ndarray
+        Values; NaN gaps are kept as gaps by ``'minmax'``.
+    n_out : int
+        Target number of points, typically twice the pixel width.
+    method : {'minmax', 'lttb'}
+        ``'minmax'`` keeps each bucket's extremes, so spikes survive;
+        ``'lttb'`` keeps the point forming the largest triangle with its
+        neighbours, which follows the visual shape with fewer points.
+
+    Returns
+    -------
+    np.ndarray[int64]
+        Increasing positions into ``x`` and ``y``.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) <= n_out:
+        return np.arange(len(y))
+    if method == 'minmax':
+        return _minmax(y, n_out)
+    if method == 'lttb':
+        return _lttb(np.asarray(x, dtype=np.float64), y, n_out)
+    raise ValueError('unknown method %r' % (method,))
+
+
+def _positions(key, x, y, lo, hi, n_out, method):
+    """Cached reduction of ``x[lo:hi], y[lo:hi]``, as positions into the
+    full arrays."""
+    cache_key = (key, lo, hi, n_out, method)
+    if cache_key in _cache:
+        _cache[cache_key] = _cache.pop(cache_key)
+        return _cache[cache_key]
+    positions = lo + downsample(x[lo:hi], y[lo:hi], n_out, method)
+    _cache[cache_key] = positions
+    while len(_cache) > _MAX_CACHED:
+        _cache.popitem(last=False)
+    return positions
+
+
+def _numeric_x(x):
+    """``x`` in the axis units matplotlib uses: days since the epoch for
+    dates, the values themselves otherwise."""
+    if isinstance(x, pd.DatetimeIndex) or \
+            np.issubdtype(np.asarray(x).dtype, np.datetime64):
+        return index_nanos(x) / _DAY_NANOS
+    return np.asarray(x, dtype=np.float64)
+
+
+def _take(x, positions):
+    if isinstance(x, pd.Index):
+        return x[positions]
+    return np.asarray(x)[positions]
+
+
+def _split(args):
+    """Group ``plt.plot`` positional arguments into ``(x, y, fmt)``."""
+    groups = []
+    args = list(args)
+    while args:
+        first = args.pop(0)
+        if args and not isinstance(args[0], str):
+            x, y = first, args.pop(0)
+        else:
+            x, y = None, first
+        fmt = args.pop(0) if args and isinstance(args[0], str) else None
+        groups.append((x, y, fmt))
+    return groups
+
+
+def _lines(x, y):
+    """Split one ``(x, y)`` group into one ``(x, y)`` pair per line."""
+    if isinstance(y, (pd.Series, pd.DataFrame)):
+        x = y.index if x is None else x
+    y = np.asarray(getattr(y, 'values', y), dtype=np.float64)
+    x = np.arange(len(y)) if x is None else x
+    if y.ndim == 2:
+        return [(x, y[:, j]) for j in range(y.shape[1])]
+    return [(x, y)]
+
+
+def plot(*args, **kwargs):
+    """Drop-in replacement for ``plt.plot`` that downsamples long lines.
+
+    Takes the arguments of ``plt.plot`` (``plot(y)``, ``plot(x, y)``, format
+    strings, keyword styles) plus:
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes, optional
+        Axes to draw on; defaults to ``plt.gca()``.
+    method : {'minmax', 'lttb'}
+        Reduction; see :func:`downsample`.
+    points_per_pixel : float
+        Points kept per pixel column of the axes. Lines shorter than that
+        are drawn as they are.
+
+    Returns
+    -------
+    list of matplotlib.lines.Line2D
+    """
+    import matplotlib.pyplot as plt
+
+    ax = kwargs.pop('ax', None) or plt.gca()
+    method = kwargs.pop('method', 'minmax')
+    points_per_pixel = kwargs.pop('points_per_pixel', 2)
+    n_out = max(int(ax.bbox.width * points_per_pixel), 16)
+
+    drawn = []
+    for x, y, fmt in _split(args):
+        for line_x, line_y in _lines(x, y):
+            numeric = _numeric_x(line_x)
+            key = (index_key(numeric), index_key(line_y))
+            positions = _positions(key, numeric, line_y, 0, len(line_y),
+                                   n_out, method)
+            line, = ax.plot(_take(line_x, positions), line_y[positions],
+                            *([fmt] if fmt else []), **kwargs)
+            _follow_zoom(ax, line, key, line_x, numeric, line_y, n_out,
+                         method)
+            drawn.append(line)
+    return drawn
+
+
+def _follow_zoom(ax, line, key, x, numeric, y, n_out, method):
+    """Re-reduce ``line`` to the visible x range whenever it changes."""
+    if len(y) <= n_out:
+        return
+
+    def on_xlim(axes):
+        lo, hi = axes.get_xlim()
+        start = max(int(np.searchsorted(numeric, lo, side='left')) - 1, 0)
+        stop = min(int(np.searchsorted(numeric, hi, side='right')) + 1,
+                   len(y))
+        positions = _positions(key, numeric, y, start, stop, n_out, method)
+        line.set_data(_take(x, positions), y[positions])
+
+    ax.callbacks.connect('xlim_changed', on_xlim)
@@ -0,0 +1,89 @@
+"""
+Expected return and volatility for many candidate portfolios at once.
+
+``Numpy.py`` evaluates a single weight vector with ``np.dot(weights,
+mean_returns)`` and ``np.dot(np.dot(weights, cov_mat), weights.T)``.
+:func:`evaluate_portfolios` does the same for a whole matrix of weights,
+working through it in blocks small enough to stay in cache and spreading the
+blocks over threads (the matrix products release the GIL).
+"""
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_BLOCK_BYTES = 4 * 2 ** 20
+
+
+def _evaluate_block(weights, mean_returns, cov, expected, variance, block):
+    w = weights[block]
+    expected[block] = np.dot(w, mean_returns)
+    if hasattr(cov, 'batch_variance'):
+        variance[block] = cov.batch_variance(w)
+    else:
+        variance[block] = np.einsum('ij,ij->i', np.dot(w, cov), w)
+
+
+def evaluate_portfolios(weights, mean_returns, cov, block_size=None,
+                        n_jobs=1):
+    """Expected returns and volatilities of many portfolios.
+
+    Parameters
+    ----------
+    weights : np.ndarray
+        Weight matrix of shape ``(n_portfolios, n_assets)``; a single vector
+        is treated as one portfolio.
+    mean_returns : array_like
+        Expected return of each asset, shape ``(n_assets,)``.
+    cov : np.ndarray or FactorCovariance
+        Dense ``(n_assets, n_assets)`` covariance, or any object providing
+        ``batch_variance`` such as :class:`research.factor.FactorCovariance`.
+    block_size : int, optional
+        Portfolios per block. Defaults to a block whose intermediate product
+        takes about 4MB.
+    n_jobs : int
+        Number of threads; ``-1`` uses one per CPU.
+
+    Returns
+    -------
+    expected : np.ndarray
+        ``weights . mean_returns`` for each portfolio.
+    volatility : np.ndarray
+        ``sqrt(w' C w)`` for each portfolio.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.ndim == 1:
+        weights = weights[np.newaxis]
+    mean_returns = np.asarray(mean_returns, dtype=np.float64)
+    n_portfolios, n_assets = weights.shape
+    if mean_returns.shape != (n_assets,):
+        raise ValueError('mean_returns must have length %d' % n_assets)
+    if not hasattr(cov, 'batch_variance'):
+        cov = np.asarray(cov, dtype=np.float64)
+        if cov.shape != (n_assets, n_assets):
+            raise ValueError('cov must be %d x %d' % (n_assets, n_assets))
+
+    if block_size is None:
+        block_size = max(1, _BLOCK_BYTES // (8 * n_assets))
+    if n_jobs == -1:
+        n_jobs = multiprocessing.cpu_count()
+
+    expected = np.empty(n_portfolios)
+    variance = np.empty(n_portfolios)
+    blocks = [slice(start, min(start + block_size, n_portfolios))
+              for start in range(0, n_portfolios, block_size)]
+    if n_jobs <= 1 or len(blocks) == 1:
+        for block in blocks:
+            _evaluate_block(weights, mean_returns, cov, expected, variance,
+                            block)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            for future in [executor.submit(_evaluate_block, weights,
+                                           mean_returns, cov, expected,
+                                           variance, block)
+                           for block in blocks]:
+                future.result()
+    np.maximum(variance, 0.0, out=variance)
+    return expected, np.sqrt(variance)
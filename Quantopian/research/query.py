@@ -0,0 +1,239 @@
+"""
+Compiled row filters over price panels.
+
+``Panda.py`` screens with ``prices.loc[(prices.MCD > prices.WFM) &
+~prices.SHAK.isnull()]``, which materialises a full-length temporary for
+every sub-expression. :class:`Filter` parses the same expression once into a
+tree of NumPy operations and evaluates it over blocks of rows small enough to
+stay in cache, so the only full-length output is the list of matching rows.
+"""
+from __future__ import absolute_import, division, print_function
+
+import ast
+import operator
+
+import numpy as np
+import pandas as pd
+
+from .store import _symbol_of
+
+_BLOCK_ROWS = 2 ** 16
+
+_COMPARE = {
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+_ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+_LOGICAL = {
+    ast.BitAnd: np.logical_and,
+    ast.BitOr: np.logical_or,
+    ast.BitXor: np.logical_xor,
+    ast.And: np.logical_and,
+    ast.Or: np.logical_or,
+}
+_MISSING = {'isnull': True, 'isna': True, 'notnull': False, 'notna': False}
+
+_MAX_COMPILED = 128
+_compiled = {}
+
+
+class Filter(object):
+    """A boolean row filter compiled from an expression.
+
+    Parameters
+    ----------
+    expression : str
+        Expression over column names, e.g.
+        ``"(prices.MCD > prices.WFM) & ~prices.SHAK.isnull()"``. Columns may
+        be written ``MCD``, ``prices.MCD`` or ``prices['MCD']``; the name in
+        front is ignored. Supported are comparisons, ``+ - * /``, ``& | ^ ~``
+        (and ``and``/``or``/``not``), ``abs()`` and the ``isnull``,
+        ``isna``, ``notnull`` and ``notna`` methods.
+
+    Comparisons with NaN are false, as in pandas.
+
+    Examples
+    --------
+    >>> screen = Filter('(MCD > WFM) & ~SHAK.isnull()')
+    >>> rows = screen.positions(prices)
+    >>> prices.iloc[rows]
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.names = []
+        tree = ast.parse(expression.strip(), mode='eval')
+        self._evaluate = self._compile(tree.body)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.expression)
+
+    def _column(self, name):
+        if name not in self.names:
+            self.names.append(name)
+        slot = self.names.index(name)
+        return lambda columns: columns[slot]
+
+    def _compile(self, node):
+        """Turn an AST node into a function of the resolved column blocks."""
+        if isinstance(node, ast.Constant) and \
+                isinstance(node.value, (int, float)):
+            value = node.value
+            return lambda columns: value
+        if isinstance(node, ast.Name):
+            return self._column(node.id)
+        if isinstance(node, ast.Attribute):
+            return self._column(node.attr)
+        if isinstance(node, ast.Subscript):
+            key = node.slice
+            if isinstance(key, ast.Constant) and isinstance(key.value, str):
+                return self._column(key.value)
+        if isinstance(node, ast.Compare):
+            terms = [self._compile(node.left)] + [
+                self._compile(right) for right in node.comparators]
+            ops = [_COMPARE[type(op)] for op in node.ops]
+
+            def compare(columns):
+                values = [term(columns) for term in terms]
+                result = ops[0](values[0], values[1])
+                for i in range(1, len(ops)):
+                    np.logical_and(result, ops[i](values[i], values[i + 1]),
+                                   out=result)
+                return result
+            return compare
+        if isinstance(node, ast.BinOp) and type(node.op) in _LOGICAL:
+            left, right = self._compile(node.left), self._compile(node.right)
+            func = _LOGICAL[type(node.op)]
+            return lambda columns: func(left(columns), right(columns))
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            left, right = self._compile(node.left), self._compile(node.right)
+            func = _ARITHMETIC[type(node.op)]
+            return lambda columns: func(left(columns), right(columns))
+        if isinstance(node, ast.BoolOp):
+            terms = [self._compile(value) for value in node.values]
+            func = _LOGICAL[type(node.op)]
+
+            def combine(columns):
+                result = func(terms[0](columns), terms[1](columns))
+                for term in terms[2:]:
+                    func(result, term(columns), out=result)
+                return result
+            return combine
+        if isinstance(node, ast.UnaryOp):
+            operand = self._compile(node.operand)
+            if isinstance(node.op, (ast.Invert, ast.Not)):
+                return lambda columns: np.logical_not(operand(columns))
+            if isinstance(node.op, ast.USub):
+                return lambda columns: -operand(columns)
+        if isinstance(node, ast.Call) and not node.args and not node.keywords:
+            func = node.func
+            if isinstance(func, ast.Attribute) and func.attr in _MISSING:
+                operand = self._compile(func.value)
+                if _MISSING[func.attr]:
+                    return lambda columns: np.isnan(operand(columns))
+                return lambda columns: ~np.isnan(operand(columns))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id == 'abs' and len(node.args) == 1:
+            operand = self._compile(node.args[0])
+            return lambda columns: np.abs(operand(columns))
+        raise ValueError('unsupported expression: %s' % ast.dump(node))
+
+    def _resolve(self, data, columns):
+        """Column positions of the names used, and the values to read."""
+        if columns is None:
+            columns = getattr(data, 'columns', None)
+        if columns is None:
+            raise ValueError('columns are needed to filter an array')
+        lookup = dict((str(_symbol_of(column)), i)
+                      for i, column in enumerate(columns))
+        lookup.update((str(column), i) for i, column in enumerate(columns))
+        try:
+            slots = [lookup[name] for name in self.names]
+        except KeyError as e:
+            raise KeyError('column %s not found' % (e.args[0],))
+        values = np.asarray(getattr(data, 'values', data))
+        return slots, values
+
+    def _masks(self, data, columns, block_rows):
+        slots, values = self._resolve(data, columns)
+        n_rows = values.shape[0]
+        block_rows = block_rows or _BLOCK_ROWS
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for lo in range(0, n_rows, block_rows):
+                hi = min(lo + block_rows, n_rows)
+                mask = self._evaluate([values[lo:hi, j] for j in slots])
+                yield lo, np.broadcast_to(mask, (hi - lo,))
+
+    def mask(self, data, columns=None, block_rows=None):
+        """Boolean array with one entry per row of ``data``."""
+        blocks = [mask for _, mask in self._masks(data, columns, block_rows)]
+        return np.concatenate(blocks) if blocks else np.zeros(0, dtype=bool)
+
+    def positions(self, data, columns=None, block_rows=None):
+        """Row positions of ``data`` where the expression holds.
+
+        Parameters
+        ----------
+        data : pd.DataFrame or np.ndarray
+            Panel with one column per name in the expression.
+        columns : sequence, optional
+            Column labels of an array ``data``.
+        block_rows : int, optional
+            Rows evaluated at a time; defaults to 65536.
+        """
+        found = [lo + np.flatnonzero(mask)
+                 for lo, mask in self._masks(data, columns, block_rows)]
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def runs(self, data, columns=None, block_rows=None):
+        """Matching rows as ``(n_runs, 2)`` ``[start, stop)`` ranges of
+        consecutive positions."""
+        rows = self.positions(data, columns, block_rows)
+        if not len(rows):
+            return np.zeros((0, 2), dtype=np.int64)
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        starts = rows[np.concatenate([[0], breaks])]
+        stops = rows[np.concatenate([breaks - 1, [len(rows) - 1]])] + 1
+        return np.column_stack([starts, stops])
+
+    def select(self, data, columns=None, block_rows=None):
+        """Rows of ``data`` where the expression holds.
+
+        When the matching rows are one contiguous range, as with a screen on
+        a listing date, the result is a slice that shares memory with
+        ``data``; otherwise the matching rows are gathered into a new object.
+        """
+        rows = self.positions(data, columns, block_rows)
+        contiguous = len(rows) and rows[-1] - rows[0] + 1 == len(rows)
+        if isinstance(data, (pd.DataFrame, pd.Series)):
+            if contiguous:
+                return data.iloc[rows[0]:rows[-1] + 1]
+            return data.iloc[rows]
+        if contiguous:
+            return data[rows[0]:rows[-1] + 1]
+        return np.asarray(data)[rows]
+
+
+def query(data, expression, columns=None):
+    """Rows of ``data`` matching ``expression``; see :class:`Filter`.
+
+    Compiled expressions are kept, so repeating a screen skips the parse.
+
+    ``query(prices, '(MCD > WFM) & ~SHAK.isnull()')`` is the equivalent of
+    ``prices.loc[(prices.MCD > prices.WFM) & ~prices.SHAK.isnull()]``.
+    """
+    screen = _compiled.get(expression)
+    if screen is None:
+        if len(_compiled) >= _MAX_COMPILED:
+            _compiled.clear()
+        screen = _compiled[expression] = Filter(expression)
+    return screen.select(data, columns)
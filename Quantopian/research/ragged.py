@@ -0,0 +1,206 @@
+"""
+Statistics over panels whose symbols have different histories.
+
+``Panda.py`` handles SHAK's late listing with ``prices.fillna(0)``,
+``prices.fillna(method='bfill')`` or ``prices.dropna()``, each of which
+copies the whole panel, and the last one throws away every other symbol's
+history before the listing date. :class:`RaggedPanel` instead records the
+first and last valid row of each symbol and summarises only the observations
+inside those bounds, reading the panel in bounded blocks so it is never
+copied or densified as a whole.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pandas as pd
+
+from .covariance import _pairwise
+
+_BLOCK_BYTES = 4 * 2 ** 20
+
+
+class RaggedPanel(object):
+    """A ``(dates, symbols)`` panel with per-symbol valid row ranges.
+
+    Parameters
+    ----------
+    data : pd.DataFrame or np.ndarray
+        Panel values; a DataFrame's values are used without copying when it
+        holds a single float block.
+    starts, ends : array_like, optional
+        Row range ``[start, end)`` of each symbol's history. Values outside
+        the range are ignored even if they are not NaN, so a zero- or
+        back-filled panel can be described without undoing the fill.
+        Defaults to the first and one past the last non-NaN row.
+
+    NaNs inside a symbol's range are skipped as well, like ``np.nanmean``.
+    """
+
+    def __init__(self, data, starts=None, ends=None):
+        if isinstance(data, pd.DataFrame):
+            self.index, self.columns = data.index, data.columns
+            data = data.values
+        else:
+            self.index = self.columns = None
+        self.values = np.asarray(data, dtype=np.float64)
+        if self.values.ndim != 2:
+            raise ValueError('a panel must be 2-dimensional')
+        if starts is None or ends is None:
+            found_starts, found_ends = self._bounds()
+            starts = found_starts if starts is None else starts
+            ends = found_ends if ends is None else ends
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.maximum(np.asarray(ends, dtype=np.int64), self.starts)
+        if self.starts.shape != (self.n_symbols,) \
+                or self.ends.shape != (self.n_symbols,):
+            raise ValueError('starts and ends must have length %d'
+                             % self.n_symbols)
+
+    @property
+    def n_dates(self):
+        return self.values.shape[0]
+
+    @property
+    def n_symbols(self):
+        return self.values.shape[1]
+
+    def _row_blocks(self, lo=0, hi=None):
+        hi = self.n_dates if hi is None else hi
+        step = max(1, _BLOCK_BYTES // (8 * max(self.n_symbols, 1)))
+        for start in range(lo, hi, step):
+            yield start, min(start + step, hi)
+
+    def _bounds(self):
+        """First and one-past-last non-NaN row of every symbol."""
+        n = self.n_symbols
+        starts = np.full(n, self.n_dates, dtype=np.int64)
+        ends = np.zeros(n, dtype=np.int64)
+        for lo, hi in self._row_blocks():
+            valid = ~np.isnan(self.values[lo:hi])
+            seen = valid.any(axis=0)
+            first = lo + np.argmax(valid, axis=0)
+            last = hi - np.argmax(valid[::-1], axis=0)
+            starts = np.where(seen & (starts == self.n_dates), first, starts)
+            ends = np.where(seen, last, ends)
+        starts[starts == self.n_dates] = 0
+        return starts, ends
+
+    def _live(self, lo, hi, block, cols=slice(None)):
+        """Mask of the observations in rows ``lo:hi`` of ``cols`` that
+        count."""
+        rows = np.arange(lo, hi)[:, np.newaxis]
+        return ((rows >= self.starts[cols]) & (rows < self.ends[cols])
+                & ~np.isnan(block))
+
+    def _span(self):
+        return int(self.starts.min(initial=0)), \
+            int(self.ends.max(initial=0))
+
+    def _wrap(self, values):
+        if self.columns is None:
+            return values
+        return pd.Series(values, index=self.columns)
+
+    def _sums(self):
+        """Count and shifted first and second moments of each symbol."""
+        n = self.n_symbols
+        # Shift by the first valid value to limit cancellation in s2.
+        shift = np.zeros(n)
+        has = self.ends > self.starts
+        first = self.values[self.starts[has], np.flatnonzero(has)]
+        shift[has] = np.where(np.isnan(first), 0.0, first)
+        count, s1, s2 = np.zeros(n), np.zeros(n), np.zeros(n)
+        for lo, hi in self._row_blocks(*self._span()):
+            block = self.values[lo:hi]
+            live = self._live(lo, hi, block)
+            centred = np.where(live, block - shift, 0.0)
+            count += live.sum(axis=0)
+            s1 += centred.sum(axis=0)
+            s2 += np.einsum('ij,ij->j', centred, centred)
+        return count, shift, s1, s2
+
+    def count(self):
+        """Number of valid observations of each symbol."""
+        return self._wrap(self._sums()[0])
+
+    def mean(self):
+        """Mean of each symbol over its valid observations."""
+        count, shift, s1, _ = self._sums()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = shift + s1 / count
+        mean[count == 0] = np.nan
+        return self._wrap(mean)
+
+    def var(self, ddof=1):
+        """Variance of each symbol over its valid observations."""
+        count, _, s1, s2 = self._sums()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (s2 - s1 * s1 / count) / (count - ddof)
+        np.maximum(var, 0.0, out=var)
+        var[count <= ddof] = np.nan
+        return self._wrap(var)
+
+    def std(self, ddof=1):
+        """Standard deviation of each symbol over its valid observations."""
+        return np.sqrt(self.var(ddof))
+
+    def median(self):
+        """Median of each symbol over its valid observations.
+
+        Symbols are taken in order of listing date, in blocks that only span
+        the rows those symbols were listed for, so each sort touches a
+        bounded copy of the panel.
+        """
+        out = np.full(self.n_symbols, np.nan)
+        order = np.argsort(self.starts, kind='mergesort')
+        lengths = self.ends - self.starts
+        width = max(1, _BLOCK_BYTES // (8 * max(int(lengths.max(initial=0)),
+                                                1)))
+        for i in range(0, len(order), width):
+            cols = order[i:i + width]
+            lo = int(self.starts[cols].min())
+            hi = int(self.ends[cols].max())
+            if hi <= lo:
+                continue
+            block = self.values[lo:hi, cols]
+            block = np.where(self._live(lo, hi, block, cols), block,
+                             np.nan)
+            block.sort(axis=0)
+            count = (~np.isnan(block)).sum(axis=0)
+            picked = np.arange(len(cols))
+            below = np.maximum(count - 1, 0) // 2
+            above = np.minimum(count // 2, hi - lo - 1)
+            median = 0.5 * (block[below, picked] + block[above, picked])
+            median[count == 0] = np.nan
+            out[cols] = median
+        return self._wrap(out)
+
+    def _pairwise(self, ddof, min_periods, correlation):
+        def valid(values, cols):
+            return self._live(0, self.n_dates, values[:, cols], cols)
+
+        result, _ = _pairwise(self.values, ddof, min_periods, correlation,
+                              valid=valid)
+        if self.columns is None:
+            return result
+        return pd.DataFrame(result, index=self.columns, columns=self.columns)
+
+    def cov(self, ddof=1, min_periods=None):
+        """Covariance of every pair of symbols over the dates both have.
+
+        Each entry uses the rows where both symbols are valid, like
+        ``DataFrame.cov``; see :func:`research.covariance.pairwise_cov`.
+
+        Parameters
+        ----------
+        ddof : int
+            Delta degrees of freedom.
+        min_periods : int, optional
+            Minimum number of shared observations; pairs with fewer get NaN.
+        """
+        return self._pairwise(ddof, min_periods, False)
+
+    def corr(self, min_periods=None):
+        """Correlation of every pair of symbols over the dates both have,
+        like ``DataFrame.corr``."""
+        return self._pairwise(1, min_periods, True)
@@ -0,0 +1,270 @@
+"""
+Vectorised resampling with shared bucket boundaries.
+
+``Panda.py`` resamples with ``prices.resample('M', how='median')`` and with a
+Python ``custom_resampler``, which calls back into Python once per bucket and
+column. :class:`Buckets` finds the bucket boundaries once, with a binary
+search of the int64 timestamp axis, and then applies segment-wise NumPy
+reductions to every column at once; a user callable is only used when the
+reduction has no vectorised kernel.
+"""
+from __future__ import absolute_import, division, print_function
+
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.tseries import offsets as _offsets
+from pandas.tseries.frequencies import to_offset
+
+from ._time import index_nanos
+
+_RIGHT_CLOSED = tuple(
+    getattr(_offsets, name)
+    for name in ('MonthEnd', 'QuarterEnd', 'YearEnd', 'BMonthEnd',
+                 'BQuarterEnd', 'BYearEnd', 'Week')
+    if hasattr(_offsets, name)
+)
+
+# Aliases renamed in later pandas releases; the lectures use the old ones.
+_RENAMED = {'M': 'ME', 'Q': 'QE', 'A': 'YE', 'Y': 'YE', 'BM': 'BME',
+            'BQ': 'BQE', 'BA': 'BYE', 'H': 'h', 'T': 'min', 'S': 's',
+            'L': 'ms'}
+
+REDUCTIONS = ('first', 'last', 'min', 'max', 'sum', 'mean', 'median',
+              'count', 'ohlc')
+
+
+def _offset(rule):
+    try:
+        return to_offset(rule)
+    except ValueError:
+        head, sep, tail = rule.partition('-')
+        multiple, alias = re.match(r'(\d*)(.*)$', head).groups()
+        if alias not in _RENAMED:
+            raise
+        return to_offset(multiple + _RENAMED[alias] + sep + tail)
+
+
+class Buckets(object):
+    """Resampling buckets of a DatetimeIndex for a frequency ``rule``.
+
+    Follows the pandas conventions: end-anchored rules (month, quarter, year
+    and week ends) close buckets on the right and label them with the period
+    end, all others close on the left and label with the period start. Empty
+    buckets inside the range are kept.
+
+    Attributes
+    ----------
+    labels : pd.DatetimeIndex
+        One label per bucket.
+    offsets : np.ndarray[int64]
+        Row positions such that bucket ``i`` is ``offsets[i]:offsets[i + 1]``.
+    """
+
+    def __init__(self, index, rule):
+        index = pd.DatetimeIndex(index)
+        offset = _offset(rule)
+        nanos = index_nanos(index)
+        if len(index) == 0:
+            self.labels = pd.DatetimeIndex([], tz=index.tz)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            return
+        first, last = index[0], index[-1]
+        if isinstance(offset, _RIGHT_CLOSED):
+            labels = pd.date_range(offset.rollforward(first.normalize()),
+                                   offset.rollforward(last.normalize()),
+                                   freq=offset)
+            # A calendar-day shift keeps every edge at local midnight across
+            # DST changes, where 24 hours would not.
+            edges = index_nanos(labels + pd.DateOffset(days=1))
+            bounds = np.searchsorted(nanos, edges, side='left')
+            offsets = np.concatenate([[0], bounds])
+        else:
+            if isinstance(offset, _offsets.Tick):
+                start = first.floor(offset)
+            else:
+                start = offset.rollback(first.normalize())
+            labels = pd.date_range(start, last, freq=offset)
+            bounds = np.searchsorted(nanos, index_nanos(labels), side='left')
+            offsets = np.concatenate([bounds, [len(nanos)]])
+        self.labels = labels
+        self.offsets = offsets.astype(np.int64)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def counts(self):
+        """Number of rows in each bucket."""
+        return np.diff(self.offsets)
+
+    def reduce(self, values, how):
+        """Reduce a ``(rows, columns)`` array bucket by bucket.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Array aligned with the index the buckets were built from.
+        how : str or callable
+            One of ``REDUCTIONS`` other than ``'ohlc'``, or a function called
+            with each bucket's 1-d array for every column.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape ``(len(self), columns)``. NaNs are skipped; empty
+            buckets give NaN, or 0 for ``'sum'`` and ``'count'``.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            return self.reduce(values[:, np.newaxis], how)[:, 0]
+        if callable(how):
+            return self._apply(values, how)
+        if how not in REDUCTIONS or how == 'ohlc':
+            raise ValueError('unknown reduction %r' % (how,))
+
+        n_buckets, n_cols = len(self), values.shape[1]
+        fill = 0.0 if how in ('sum', 'count') else np.nan
+        out = np.full((n_buckets, n_cols), fill)
+        counts = self.counts
+        nonempty = counts > 0
+        if not nonempty.any():
+            return out
+        starts = self.offsets[:-1][nonempty]
+        ends = self.offsets[1:][nonempty]
+        valid = ~np.isnan(values)
+        has_nan = not valid.all()
+
+        if how in ('sum', 'mean', 'count'):
+            n_valid = np.add.reduceat(valid, starts, axis=0) if has_nan \
+                else np.repeat(counts[nonempty][:, np.newaxis], n_cols, axis=1)
+            if how == 'count':
+                out[nonempty] = n_valid
+                return out
+            filled = np.where(valid, values, 0.0) if has_nan else values
+            total = np.add.reduceat(filled, starts, axis=0)
+            if how == 'sum':
+                out[nonempty] = total
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    out[nonempty] = total / n_valid
+        elif how == 'min':
+            out[nonempty] = np.fmin.reduceat(values, starts, axis=0)
+        elif how == 'max':
+            out[nonempty] = np.fmax.reduceat(values, starts, axis=0)
+        elif how in ('first', 'last'):
+            if not has_nan:
+                rows = starts if how == 'first' else ends - 1
+                out[nonempty] = values[rows]
+            else:
+                out[nonempty] = self._first_last(values, valid, starts, ends,
+                                                 how)
+        else:
+            out[nonempty] = self._median(values, valid, starts)
+        return out
+
+    def _first_last(self, values, valid, starts, ends, how):
+        rows = np.arange(len(values))[:, np.newaxis]
+        cols = np.arange(values.shape[1])
+        if how == 'first':
+            pos = np.minimum.reduceat(np.where(valid, rows, len(values)),
+                                      starts, axis=0)
+            found = pos < ends[:, np.newaxis]
+        else:
+            pos = np.maximum.reduceat(np.where(valid, rows, -1), starts,
+                                      axis=0)
+            found = pos >= starts[:, np.newaxis]
+        picked = values[np.clip(pos, 0, len(values) - 1), cols]
+        return np.where(found, picked, np.nan)
+
+    def _median(self, values, valid, starts):
+        counts = self.counts
+        nonempty = counts > 0
+        n_valid = np.add.reduceat(valid, starts, axis=0)
+        cols = np.arange(values.shape[1])
+        width = counts.max()
+        if nonempty.sum() * width <= 4 * len(values):
+            # Scatter each bucket into a NaN-padded row of a 3-d block and
+            # sort along the bucket axis; NaNs sort to the end of each row.
+            bucket = np.repeat(np.arange(nonempty.sum()), counts[nonempty])
+            within = np.arange(len(values)) - np.repeat(starts,
+                                                        counts[nonempty])
+            block = np.full((nonempty.sum(), width, values.shape[1]), np.nan)
+            block[bucket, within] = values
+            block.sort(axis=1)
+            rows = np.arange(len(block))[:, np.newaxis]
+            lo = np.maximum(n_valid - 1, 0) // 2
+            hi = np.minimum(n_valid // 2, width - 1)
+            median = 0.5 * (block[rows, lo, cols] + block[rows, hi, cols])
+        else:
+            # Very uneven buckets: sort by (bucket, value) in one call.
+            bucket = np.repeat(np.arange(len(self)), counts)
+            order = np.lexsort(
+                (values, np.broadcast_to(bucket[:, np.newaxis], values.shape)),
+                axis=0)
+            ordered = np.take_along_axis(values, order, axis=0)
+            lo = starts[:, np.newaxis] + np.maximum(n_valid - 1, 0) // 2
+            hi = np.minimum(starts[:, np.newaxis] + n_valid // 2,
+                            len(values) - 1)
+            median = 0.5 * (ordered[lo, cols] + ordered[hi, cols])
+        median[n_valid == 0] = np.nan
+        return median
+
+    def _apply(self, values, func):
+        out = np.full((len(self), values.shape[1]), np.nan)
+        for i, (start, end) in enumerate(zip(self.offsets[:-1],
+                                             self.offsets[1:])):
+            if start == end:
+                continue
+            for j in range(values.shape[1]):
+                out[i, j] = func(values[start:end, j])
+        return out
+
+    def ohlc(self, values):
+        """Open, high, low and close of each bucket, shape
+        ``(len(self), columns, 4)``."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, np.newaxis]
+        return np.stack([self.reduce(values, how)
+                         for how in ('first', 'max', 'min', 'last')], axis=2)
+
+
+def resample(data, rule, how='last'):
+    """Resample a Series or DataFrame with vectorised reductions.
+
+    Parameters
+    ----------
+    data : pd.Series or pd.DataFrame
+        Data with a DatetimeIndex.
+    rule : str
+        Frequency alias, e.g. ``'M'`` or ``'W'``.
+    how : str or callable
+        Reduction from ``REDUCTIONS`` or a function of a bucket's values, as
+        with ``prices.resample('M', how=custom_resampler)``.
+
+    Returns
+    -------
+    pd.Series or pd.DataFrame
+        Indexed by the bucket labels. ``'ohlc'`` returns open/high/low/close
+        columns, nested under the original columns for a DataFrame.
+    """
+    buckets = Buckets(data.index, rule)
+    values = np.asarray(data.values, dtype=np.float64)
+    series = isinstance(data, pd.Series)
+    if series:
+        values = values[:, np.newaxis]
+    if how == 'ohlc':
+        block = buckets.ohlc(values)
+        fields = ['open', 'high', 'low', 'close']
+        if series:
+            return pd.DataFrame(block[:, 0], index=buckets.labels,
+                                columns=fields)
+        columns = pd.MultiIndex.from_product([data.columns, fields])
+        return pd.DataFrame(block.reshape(len(buckets), -1),
+                            index=buckets.labels, columns=columns)
+    out = buckets.reduce(values, how)
+    if series:
+        return pd.Series(out[:, 0], index=buckets.labels, name=data.name)
+    return pd.DataFrame(out, index=buckets.labels, columns=data.columns)
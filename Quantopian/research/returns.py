@@ -0,0 +1,129 @@
+"""
+Simple, log and difference returns from one pass over a price panel.
+
+The lectures compute ``prices.diff()[1:]`` and ``prices.pct_change()[1:]``
+separately, each reading the whole panel, allocating a full result with a
+leading NaN row and then copying everything but that row. :func:`returns`
+walks the panel once in cache-sized blocks, derives every requested kind
+from the same price difference, and writes straight into output buffers that
+start at the second row, which may be preallocated and may be float32.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pandas as pd
+
+from .store import string_types
+
+KINDS = ('simple', 'log', 'diff')
+
+_BLOCK_BYTES = 2 ** 20
+
+
+def _outputs(kinds, out, shape, dtype, order):
+    """Validate or allocate one output buffer per kind."""
+    if out is None:
+        out = {}
+    elif not isinstance(out, dict):
+        out = dict(zip(kinds, out))
+    buffers = {}
+    for kind in kinds:
+        buf = out.get(kind)
+        if buf is None:
+            buf = np.empty(shape, dtype=dtype, order=order)
+        elif buf.shape != shape:
+            raise ValueError('out[%r] must have shape %s, got %s'
+                             % (kind, shape, buf.shape))
+        elif buf.dtype.kind != 'f':
+            raise ValueError('out[%r] must be a float array' % (kind,))
+        buffers[kind] = buf
+    return buffers
+
+
+def returns(prices, kinds=KINDS, out=None, dtype=np.float64, block_rows=None):
+    """Per-period returns of a price series or panel.
+
+    ``returns(prices, 'simple')`` matches ``prices.pct_change()[1:]`` and
+    ``returns(prices, 'diff')`` matches ``prices.diff()[1:]``; ``'log'``
+    gives ``np.log(prices / prices.shift(1))[1:]``. NaN prices give NaN
+    returns; nothing is filled.
+
+    Parameters
+    ----------
+    prices : pd.Series, pd.DataFrame or np.ndarray
+        Prices with one row per period.
+    kinds : str or sequence of {'simple', 'log', 'diff'}
+        Returns to compute.
+    out : dict or sequence of np.ndarray, optional
+        Preallocated float buffers, keyed by kind or in the order of
+        ``kinds``, each with one row fewer than ``prices``.
+    dtype : np.dtype
+        Dtype of buffers that are allocated here, e.g. ``np.float32`` to
+        halve memory. Arithmetic is always done in float64.
+    block_rows : int, optional
+        Rows per block; defaults to blocks of about 1MB. Column-major input,
+        such as the values of a DataFrame, is walked in blocks of whole
+        columns instead.
+
+    Returns
+    -------
+    result or tuple of results
+        One result per kind, of the type of ``prices`` and indexed from the
+        second period; a single result when ``kinds`` is a string.
+    """
+    single = isinstance(kinds, string_types)
+    kinds = (kinds,) if single else tuple(kinds)
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        raise ValueError('unknown return kinds: %s' % sorted(unknown))
+
+    values = np.asarray(getattr(prices, 'values', prices))
+    flat = values.ndim == 1
+    if flat:
+        values = values[:, np.newaxis]
+    n_rows, n_cols = values.shape
+    n_out = max(n_rows - 1, 0)
+    shape = (n_out,) if flat else (n_out, n_cols)
+    by_column = not flat and values.flags.f_contiguous \
+        and not values.flags.c_contiguous
+    buffers = _outputs(kinds, out, shape, dtype, 'F' if by_column else 'C')
+    views = dict((kind, buf[:, np.newaxis] if flat else buf)
+                 for kind, buf in buffers.items())
+
+    if by_column:
+        width = max(1, _BLOCK_BYTES // (8 * max(n_rows, 1)))
+        blocks = [(slice(0, n_out), slice(lo, lo + width))
+                  for lo in range(0, n_cols, width)]
+    else:
+        if block_rows is None:
+            block_rows = max(1, _BLOCK_BYTES // (8 * max(n_cols, 1)))
+        blocks = [(slice(lo, min(lo + block_rows, n_out)), slice(None))
+                  for lo in range(0, n_out, block_rows)]
+    need_ratio = 'simple' in kinds or 'log' in kinds
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for rows, cols in blocks:
+            prev = values[rows, cols]
+            delta = np.subtract(values[rows.start + 1:rows.stop + 1, cols],
+                                prev, dtype=np.float64)
+            if 'diff' in kinds:
+                views['diff'][rows, cols] = delta
+            if need_ratio:
+                np.divide(delta, prev, out=delta)
+                if 'simple' in kinds:
+                    views['simple'][rows, cols] = delta
+                if 'log' in kinds:
+                    np.log1p(delta, out=views['log'][rows, cols])
+
+    if isinstance(prices, pd.Series):
+        def wrap(buf):
+            return pd.Series(buf, index=prices.index[1:], name=prices.name,
+                             copy=False)
+    elif isinstance(prices, pd.DataFrame):
+        def wrap(buf):
+            return pd.DataFrame(buf, index=prices.index[1:],
+                                columns=prices.columns, copy=False)
+    else:
+        def wrap(buf):
+            return buf
+    results = tuple(wrap(buffers[kind]) for kind in kinds)
+    return results[0] if single else results
@@ -0,0 +1,371 @@
+"""
+Rolling mean and standard deviation, in batch and streaming form.
+
+The lectures use ``pd.rolling_mean(prices, 30)`` and
+``pd.rolling_std(prices, 30)``, which have since been removed from pandas.
+:func:`rolling_mean` and :func:`rolling_std` are drop-in replacements that
+work on a whole panel at once, :func:`rolling_stats` computes several windows
+and statistics from one set of shared sums, and :class:`RollingWindow` keeps
+the same statistics up to date one bar at a time in O(1) per symbol.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pandas as pd
+
+
+def _as_2d(arg):
+    """Return a float64 ``(rows, columns)`` view of ``arg`` and a function
+    wrapping a result of the same shape back into ``arg``'s type."""
+    if isinstance(arg, pd.Series):
+        def wrap(out):
+            return pd.Series(out[:, 0], index=arg.index, name=arg.name,
+                             copy=False)
+        return np.asarray(arg.values, dtype=np.float64)[:, np.newaxis], wrap
+    if isinstance(arg, pd.DataFrame):
+        def wrap(out):
+            return pd.DataFrame(out, index=arg.index, columns=arg.columns,
+                                copy=False)
+        return np.asarray(arg.values, dtype=np.float64), wrap
+    values = np.asarray(arg, dtype=np.float64)
+    if values.ndim == 1:
+        return values[:, np.newaxis], lambda out: out[:, 0]
+    return values, lambda out: out
+
+
+class _BlockSums(object):
+    """Windowed sums of the count, first and second moments of a panel.
+
+    Rows are split into blocks of ``block`` rows and each block gets its own
+    prefix sums. A window of up to ``block`` rows spans at most two blocks, so
+    its sum is a difference of two prefixes in the same block, plus, for the
+    first ``window - 1`` rows of a block, the tail of the previous block.
+    Rounding error is therefore bounded by the block length rather than
+    growing with the length of the series, and one set of block sums serves
+    every window up to ``block``. Values are centred on their column mean
+    before summing to limit cancellation.
+
+    Counts are summed as integers, and not at all when the panel has no
+    NaNs. Arrays follow the memory order of ``values``.
+    """
+
+    def __init__(self, values, block, second_moment=True):
+        n_rows, n_cols = values.shape
+        valid = ~np.isnan(values)
+        self.complete = bool(valid.all())
+        if self.complete:
+            valid = None
+            shift = values.mean(axis=0) if n_rows else np.zeros(n_cols)
+        else:
+            counts = valid.sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shift = np.nansum(values, axis=0) / counts
+            shift[counts == 0] = 0.0
+        self.shift = shift
+        self.n_rows = n_rows
+        self.block = block
+        self.order = 'F' if values.flags.f_contiguous \
+            and not values.flags.c_contiguous else 'C'
+        n_blocks = max(-(-n_rows // block), 1)
+        self._shape = (n_blocks * block, n_cols)
+
+        self._prefix = {}
+        centred = self.empty()
+        centred[n_rows:] = 0.0
+        np.subtract(values, shift, out=centred[:n_rows])
+        if valid is not None:
+            np.copyto(centred[:n_rows], 0.0, where=~valid)
+        if second_moment:
+            self._prefix['s2'] = self._cumsum(np.multiply(centred, centred,
+                                                          out=self.empty()))
+        self._prefix['s1'] = self._cumsum(centred)
+        if valid is not None:
+            count = self.empty(np.int32)
+            count[n_rows:] = 0
+            count[:n_rows] = valid
+            self._prefix['count'] = self._cumsum(count)
+
+    def empty(self, dtype=np.float64):
+        """Uninitialised array of the padded panel shape."""
+        return np.empty(self._shape, dtype=dtype, order=self.order)
+
+    def _blocks(self, array):
+        return array.reshape(-1, self.block, array.shape[1])
+
+    def _cumsum(self, array):
+        blocks = self._blocks(array)
+        np.cumsum(blocks, axis=1, out=blocks)
+        return blocks
+
+    def window(self, name, window, out=None):
+        """Sum of ``name`` over the trailing ``window`` rows of each row,
+        written to ``out`` (see :meth:`empty`) when given."""
+        if window > self.block:
+            raise ValueError('window %d exceeds block size %d'
+                             % (window, self.block))
+        prefix = self._prefix[name]
+        if out is None:
+            out = self.empty(prefix.dtype)
+        blocks = self._blocks(out)
+        # Windows ending at offset >= window lie inside a single block.
+        np.subtract(prefix[:, window:], prefix[:, :self.block - window],
+                    out=blocks[:, window:])
+        blocks[:, :window] = prefix[:, :window]
+        # Shorter offsets reach back into the tail of the previous block.
+        if window > 1:
+            tail = prefix[:-1, self.block - window:self.block - 1]
+            tail -= prefix[:-1, -1:]
+            blocks[1:, :window - 1] -= tail
+            tail += prefix[:-1, -1:]
+        return out[:self.n_rows]
+
+    def count(self, window):
+        """Number of valid values in each trailing window, as an array that
+        broadcasts against the panel."""
+        if self.complete:
+            rows = np.arange(1, self.n_rows + 1)
+            return np.minimum(rows, window)[:, np.newaxis]
+        return self.window('count', window)
+
+
+_STATS = ('mean', 'std', 'var')
+
+# Target size of each block-sum array; see _rolling.
+_CHUNK_BYTES = 2 ** 20
+
+
+def _moments(sums, window, min_periods, ddof, stats):
+    """Compute the requested ``stats`` for one window from shared sums."""
+    count = sums.count(window)
+    # Centred window means, written in place over the window sums.
+    mean = sums.window('s1', window)
+    out = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean /= count
+        if 'std' in stats or 'var' in stats:
+            var = sums.window('s2', window)
+            # s2 - s1^2 / count, as s2 - mean^2 * count.
+            scratch = np.multiply(mean, mean, out=sums.empty()[:sums.n_rows])
+            scratch *= count
+            var -= scratch
+            del scratch
+            var /= count - ddof
+            np.maximum(var, 0.0, out=var)
+            np.copyto(var, np.nan,
+                      where=(count <= ddof) | (count < min_periods))
+            if 'var' in stats:
+                out['var'] = var
+            if 'std' in stats:
+                out['std'] = np.sqrt(var) if 'var' in stats \
+                    else np.sqrt(var, out=var)
+    if 'mean' in stats:
+        mean += sums.shift
+        np.copyto(mean, np.nan, where=(count < min_periods) | (count == 0))
+        out['mean'] = mean
+    return out
+
+
+def _rolling(values, windows, stats, periods, ddof):
+    """``{window: {stat: array}}`` for a float64 ``(rows, columns)`` panel.
+
+    Columns are processed in chunks of about ``_CHUNK_BYTES`` per block-sum
+    array, so the shared sums and every intermediate stay chunk-sized and
+    the only full-size allocations are the results themselves.
+    """
+    n_rows, n_cols = values.shape
+    block = max(windows)
+    order = 'F' if values.flags.f_contiguous \
+        and not values.flags.c_contiguous else 'C'
+    results = dict((window, dict((stat, np.empty((n_rows, n_cols),
+                                                 order=order))
+                                 for stat in stats))
+                   for window in windows)
+    padded = max(-(-n_rows // block), 1) * block
+    width = max(_CHUNK_BYTES // (8 * padded), 1)
+    for lo in range(0, n_cols, width):
+        columns = slice(lo, lo + width)
+        sums = _BlockSums(values[:, columns], block,
+                          second_moment='std' in stats or 'var' in stats)
+        for window in windows:
+            computed = _moments(sums, window, periods[window], ddof, stats)
+            for stat in stats:
+                results[window][stat][:, columns] = computed[stat]
+    return results
+
+
+def rolling_mean(arg, window, min_periods=None):
+    """Moving average over the trailing ``window`` observations.
+
+    Behaves like the removed ``pd.rolling_mean``: NaNs are skipped and a value
+    is produced once at least ``min_periods`` (default ``window``) valid
+    observations are in the window. Accepts and returns a Series, DataFrame
+    or ndarray.
+    """
+    values, wrap = _as_2d(arg)
+    periods = {window: window if min_periods is None else min_periods}
+    return wrap(_rolling(values, [window], ('mean',), periods, 1)
+                [window]['mean'])
+
+
+def rolling_std(arg, window, min_periods=None, ddof=1):
+    """Moving standard deviation over the trailing ``window`` observations.
+
+    Behaves like the removed ``pd.rolling_std``; see :func:`rolling_mean`.
+    """
+    values, wrap = _as_2d(arg)
+    periods = {window: window if min_periods is None else min_periods}
+    return wrap(_rolling(values, [window], ('std',), periods, ddof)
+                [window]['std'])
+
+
+def rolling_stats(arg, windows, stats=('mean', 'std'), min_periods=None,
+                  ddof=1):
+    """Several rolling statistics over several windows in one sweep.
+
+    The block sums are built once per chunk of columns, with blocks as long
+    as the largest window, and every (window, statistic) pair is read off
+    them, instead of making one pass over ``arg`` per window and per
+    statistic. The time is linear in the size of ``arg`` and in the number
+    of results, independent of the window lengths; only the results are
+    allocated at full size, the working arrays being bounded by the chunk.
+
+    Parameters
+    ----------
+    arg : pd.Series, pd.DataFrame or np.ndarray
+        Input panel.
+    windows : iterable of int
+        Window lengths, e.g. ``[10, 30, 60, 200]``.
+    stats : iterable of {'mean', 'std', 'var'}
+        Statistics to compute for every window.
+    min_periods : int or dict, optional
+        Minimum valid observations, either one value for all windows or a
+        mapping from window to value. Defaults to the window length.
+    ddof : int
+        Delta degrees of freedom of ``std`` and ``var``.
+
+    Returns
+    -------
+    dict
+        ``{window: {stat: result}}`` where each result has the type and shape
+        of ``arg``.
+    """
+    windows = sorted(set(int(w) for w in windows))
+    stats = tuple(stats)
+    unknown = set(stats) - set(_STATS)
+    if unknown:
+        raise ValueError('unknown statistics: %s' % sorted(unknown))
+    values, wrap = _as_2d(arg)
+    periods = {}
+    for window in windows:
+        if isinstance(min_periods, dict):
+            periods[window] = min_periods.get(window, window)
+        else:
+            periods[window] = window if min_periods is None else min_periods
+    results = _rolling(values, windows, stats, periods, ddof)
+    return dict((window, dict((stat, wrap(result[stat])) for stat in stats))
+                for window, result in results.items())
+
+
+class RollingWindow(object):
+    """Streaming rolling mean and standard deviation for many symbols.
+
+    Each :meth:`update` takes one new bar for every symbol and adjusts the
+    running mean and sum of squared deviations with Welford's add/remove
+    recurrences, so a tick costs O(1) per symbol regardless of ``window``.
+    To keep the recurrences from drifting, the statistics are recomputed
+    exactly from the window buffer every ``window`` updates, which keeps the
+    amortised cost O(1).
+
+    Parameters
+    ----------
+    window : int
+        Number of bars in the window.
+    n_symbols : int
+        Number of symbols updated together.
+    min_periods : int, optional
+        Minimum number of valid bars for a statistic; defaults to ``window``.
+    ddof : int
+        Delta degrees of freedom of the standard deviation.
+    """
+
+    def __init__(self, window, n_symbols, min_periods=None, ddof=1):
+        self.window = window
+        self.n_symbols = n_symbols
+        self.min_periods = window if min_periods is None else min_periods
+        self.ddof = ddof
+        self._buffer = np.full((window, n_symbols), np.nan)
+        self._pos = 0
+        self._since_refresh = 0
+        self.count = np.zeros(n_symbols)
+        self._mean = np.zeros(n_symbols)
+        self._m2 = np.zeros(n_symbols)
+
+    @classmethod
+    def from_history(cls, history, window, min_periods=None, ddof=1):
+        """Create a window primed with the last ``window`` rows of
+        ``history`` (an array or DataFrame of shape ``(bars, symbols)``)."""
+        values, _ = _as_2d(history)
+        rolling = cls(window, values.shape[1], min_periods, ddof)
+        for row in values[-window:]:
+            rolling.update(row)
+        return rolling
+
+    def update(self, row):
+        """Add one bar (NaN for symbols without a value) and drop the oldest."""
+        new = np.asarray(row, dtype=np.float64)
+        old = self._buffer[self._pos].copy()
+        self._buffer[self._pos] = new
+        self._pos = (self._pos + 1) % self.window
+
+        self._since_refresh += 1
+        if self._since_refresh >= self.window:
+            self._refresh()
+            return self
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            leaving = ~np.isnan(old)
+            count = self.count - leaving
+            delta = np.where(leaving, old - self._mean, 0.0)
+            mean = np.where(leaving & (count > 0),
+                            self._mean - delta / count, self._mean)
+            self._m2 -= np.where(leaving, delta * (old - mean), 0.0)
+            mean[count == 0] = 0.0
+            self._m2[count == 0] = 0.0
+
+            entering = ~np.isnan(new)
+            count += entering
+            delta = np.where(entering, new - mean, 0.0)
+            mean = np.where(entering, mean + delta / count, mean)
+            self._m2 += np.where(entering, delta * (new - mean), 0.0)
+        np.maximum(self._m2, 0.0, out=self._m2)
+        self.count = count
+        self._mean = mean
+        return self
+
+    def _refresh(self):
+        """Recompute the statistics exactly from the buffer."""
+        valid = ~np.isnan(self._buffer)
+        self.count = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid, self._buffer, 0.0).sum(axis=0) / self.count
+        mean[self.count == 0] = 0.0
+        dev = np.where(valid, self._buffer - mean, 0.0)
+        self._mean = mean
+        self._m2 = (dev * dev).sum(axis=0)
+        self._since_refresh = 0
+
+    @property
+    def mean(self):
+        """Current window mean of each symbol."""
+        out = self._mean.copy()
+        out[self.count < max(self.min_periods, 1)] = np.nan
+        return out
+
+    @property
+    def std(self):
+        """Current window standard deviation of each symbol."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = np.sqrt(self._m2 / (self.count - self.ddof))
+        out[(self.count < self.min_periods) | (self.count <= self.ddof)] = \
+            np.nan
+        return out
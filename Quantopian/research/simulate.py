@@ -0,0 +1,165 @@
+"""
+Vectorised, chunked generator for the correlated universe built in
+``Numpy.py``.
+
+The lecture draws a base return series ``R_1 ~ N(1.01, 0.03)`` and then, one
+asset at a time, adds ``N(0.001, 0.02)`` noise to it and takes the cumulative
+product. :class:`UniverseSimulator` produces the same construction for many
+thousands of assets by drawing whole blocks of rows at once and yielding them
+in asset or day chunks, so the full matrix never has to fit in memory.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+_CHUNK_BYTES = 32 * 2 ** 20
+
+
+class UniverseSimulator(object):
+    """Random universe of assets correlated through a shared base asset.
+
+    Parameters
+    ----------
+    n_assets : int
+        Number of assets, including the base asset in row 0.
+    n_days : int
+        Number of daily returns per asset.
+    base_mean, base_std : float
+        Parameters of the base asset's gross daily returns.
+    noise_mean, noise_std : float
+        Parameters of the noise added to the base returns for every other
+        asset.
+    dtype : np.dtype
+        Output dtype, e.g. ``np.float32`` to halve memory.
+    seed : int, optional
+        Seed for the random state.
+
+    Notes
+    -----
+    Draws are made in float64 and cast per chunk. Chunking by asset consumes
+    the random stream in the same order as one full-size draw, so results for
+    a given seed do not depend on ``chunk_size`` when ``axis=0``.
+    """
+
+    def __init__(self, n_assets, n_days, base_mean=1.01, base_std=0.03,
+                 noise_mean=0.001, noise_std=0.02, dtype=np.float64,
+                 seed=None):
+        self.n_assets = n_assets
+        self.n_days = n_days
+        self.noise_mean = noise_mean
+        self.noise_std = noise_std
+        self.dtype = np.dtype(dtype)
+        self.seed = seed
+        self.base = np.random.RandomState(seed).normal(
+            base_mean, base_std, n_days)
+
+    def _default_chunk(self, axis):
+        other = self.n_days if axis == 0 else self.n_assets
+        return max(1, _CHUNK_BYTES // (8 * max(other, 1)))
+
+    def iter_chunks(self, chunk_size=None, axis=0):
+        """Yield the universe in blocks.
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            Number of assets (``axis=0``) or days (``axis=1``) per block.
+        axis : {0, 1}
+            Whether to chunk over assets or over days.
+
+        Yields
+        ------
+        index : slice
+            Asset rows or day columns covered by the block.
+        returns : np.ndarray
+            Gross returns of shape ``(assets, days)`` for the block.
+        prices : np.ndarray
+            Cumulative products of the returns, continued across day blocks.
+        """
+        if axis not in (0, 1):
+            raise ValueError('axis must be 0 or 1')
+        if chunk_size is None:
+            chunk_size = self._default_chunk(axis)
+        rng = np.random.RandomState(None if self.seed is None
+                                    else self.seed + 1)
+        if axis == 0:
+            for start in range(0, self.n_assets, chunk_size):
+                stop = min(start + chunk_size, self.n_assets)
+                noise = rng.normal(self.noise_mean, self.noise_std,
+                                   (stop - start, self.n_days))
+                noise += self.base
+                if start == 0:
+                    noise[0] = self.base
+                returns = noise.astype(self.dtype, copy=False)
+                prices = np.cumprod(returns, axis=1, dtype=self.dtype)
+                yield slice(start, stop), returns, prices
+        else:
+            last = np.ones((self.n_assets, 1), dtype=self.dtype)
+            for start in range(0, self.n_days, chunk_size):
+                stop = min(start + chunk_size, self.n_days)
+                noise = rng.normal(self.noise_mean, self.noise_std,
+                                   (self.n_assets, stop - start))
+                noise += self.base[start:stop]
+                noise[0] = self.base[start:stop]
+                returns = noise.astype(self.dtype, copy=False)
+                prices = np.cumprod(returns, axis=1, dtype=self.dtype)
+                prices *= last
+                last = prices[:, -1:].copy()
+                yield slice(start, stop), returns, prices
+
+    def simulate(self, chunk_size=None, axis=0, returns_out=None,
+                 prices_out=None):
+        """Materialise the universe.
+
+        Parameters
+        ----------
+        chunk_size, axis
+            See :meth:`iter_chunks`.
+        returns_out, prices_out : str or np.ndarray, optional
+            Destinations for the returns and prices. A string is treated as a
+            path and opened as a ``.npy`` memory map, so the result is streamed
+            to disk chunk by chunk. Pass ``False`` to skip an output.
+
+        Returns
+        -------
+        returns, prices : np.ndarray or np.memmap or None
+        """
+        shape = (self.n_assets, self.n_days)
+        returns_out = self._output(returns_out, shape)
+        prices_out = self._output(prices_out, shape)
+        for index, returns, prices in self.iter_chunks(chunk_size, axis):
+            key = index if axis == 0 else (slice(None), index)
+            if returns_out is not None:
+                returns_out[key] = returns
+            if prices_out is not None:
+                prices_out[key] = prices
+        for out in (returns_out, prices_out):
+            if isinstance(out, np.memmap):
+                out.flush()
+        return returns_out, prices_out
+
+    def _output(self, out, shape):
+        if out is False:
+            return None
+        if out is None:
+            return np.empty(shape, dtype=self.dtype)
+        if isinstance(out, np.ndarray):
+            if out.shape != shape:
+                raise ValueError('output has shape %s, expected %s'
+                                 % (out.shape, shape))
+            return out
+        return np.lib.format.open_memmap(out, mode='w+', dtype=self.dtype,
+                                         shape=shape)
+
+
+def simulate_universe(n_assets, n_days, chunk_size=None, dtype=np.float64,
+                      seed=None, returns_out=None, prices_out=None, **params):
+    """Build the ``returns`` and ``assets`` arrays from ``Numpy.py`` for an
+    arbitrarily large universe.
+
+    ``params`` are forwarded to :class:`UniverseSimulator`.
+    """
+    simulator = UniverseSimulator(n_assets, n_days, dtype=dtype, seed=seed,
+                                  **params)
+    return simulator.simulate(chunk_size=chunk_size, returns_out=returns_out,
+                              prices_out=prices_out)
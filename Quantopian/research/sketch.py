@@ -0,0 +1,225 @@
+"""
+Quantile sketches for medians and empirical CDFs without sorting everything.
+
+``Panda.py`` prints ``np.median(mult_returns)`` and ``mult_returns.median()``,
+and ``Plotting Data.py`` reads an empirical CDF off
+``plt.hist(R, bins=20, cumulative=True)``; all of them need every value in
+memory. :class:`QuantileSketch` is a KLL sketch: values go into a small
+buffer that, when full, is sorted and halved by keeping every other item at
+twice the weight. Memory stays at about ``3 * k`` values however many are
+added, rank queries are off by about ``2.5 / k`` of the count, and sketches
+built per bar, per symbol or per process merge into one.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pandas as pd
+
+_SHRINK = 2 / 3
+
+
+class QuantileSketch(object):
+    """Mergeable KLL quantile sketch of a stream of floats.
+
+    Parameters
+    ----------
+    k : int
+        Size of the largest buffer. The rank error shrinks as ``1 / k`` and
+        the memory grows as ``k``; 200 keeps quantiles within about one
+        percentile in under 5KB.
+    seed : int, optional
+        Seed of the coin that picks which half of a buffer survives.
+
+    The minimum and maximum are kept exactly. NaNs are counted in
+    :attr:`missing` and otherwise ignored.
+
+    Examples
+    --------
+    >>> sketch = QuantileSketch()
+    >>> for chunk in chunks:
+    ...     sketch.update(chunk)
+    >>> sketch.median(), sketch.quantile([0.05, 0.95]), sketch.cdf(0.0)
+    """
+
+    def __init__(self, k=200, seed=None):
+        if k < 8:
+            raise ValueError('k must be at least 8')
+        self.k = int(k)
+        self.count = 0
+        self.missing = 0
+        self.min = np.nan
+        self.max = np.nan
+        self._levels = [np.zeros(0)]
+        self._pending = []
+        self._n_pending = 0
+        self._random = np.random.RandomState(seed)
+
+    def _capacity(self, level):
+        depth = len(self._levels) - 1 - level
+        return max(2, int(np.ceil(self.k * _SHRINK ** depth)))
+
+    def _flush(self):
+        """Move buffered updates into the lowest level."""
+        if self._pending:
+            self._levels[0] = np.hstack([self._levels[0]] + self._pending)
+            self._pending = []
+            self._n_pending = 0
+
+    def _compress(self):
+        self._flush()
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.zeros(0))
+                items = np.sort(items)
+                # An odd item out stays behind so the total weight is exact.
+                start = len(items) % 2
+                offset = self._random.randint(2)
+                self._levels[level + 1] = np.concatenate(
+                    [self._levels[level + 1], items[start + offset::2]])
+                self._levels[level] = items[:start]
+            level += 1
+
+    def update(self, values):
+        """Add one value or an array of values."""
+        if isinstance(values, (float, int, np.floating, np.integer)):
+            return self._add(float(values))
+        values = np.asarray(values, dtype=np.float64).ravel()
+        valid = values[~np.isnan(values)]
+        self.missing += len(values) - len(valid)
+        if not len(valid):
+            return self
+        low, high = valid.min(), valid.max()
+        self.min = low if self.count == 0 else min(self.min, low)
+        self.max = high if self.count == 0 else max(self.max, high)
+        self.count += len(valid)
+        self._pending.append(valid)
+        self._n_pending += len(valid)
+        if len(self._levels[0]) + self._n_pending >= self._capacity(0):
+            self._compress()
+        return self
+
+    def _add(self, value):
+        """Per-bar path of :meth:`update`, without array overheads."""
+        if value != value:
+            self.missing += 1
+            return self
+        if self.count == 0:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.count += 1
+        self._pending.append(value)
+        self._n_pending += 1
+        if len(self._levels[0]) + self._n_pending >= self._capacity(0):
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold in another sketch, e.g. of another symbol or process."""
+        other._flush()
+        self._flush()
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.zeros(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        if other.count:
+            self.min = other.min if self.count == 0 else min(self.min,
+                                                             other.min)
+            self.max = other.max if self.count == 0 else max(self.max,
+                                                             other.max)
+        self.count += other.count
+        self.missing += other.missing
+        self._compress()
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        return QuantileSketch(self.k).merge(self).merge(other)
+
+    @property
+    def size(self):
+        """Number of values retained."""
+        return sum(len(items) for items in self._levels) + self._n_pending
+
+    def _weighted(self):
+        """Retained items in order with the cumulative weight at each."""
+        self._flush()
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level, np.int64)
+                                  for level, items in enumerate(self._levels)])
+        order = np.argsort(items, kind='mergesort')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Value at quantile(s) ``q`` in [0, 1]; NaN when empty."""
+        q = np.asarray(q, dtype=np.float64)
+        if ((q < 0) | (q > 1)).any():
+            raise ValueError('quantiles must be between 0 and 1')
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+        items, ranks = self._weighted()
+        position = np.searchsorted(ranks, q * self.count, side='left')
+        out = items[np.minimum(position, len(items) - 1)]
+        out = np.where(q == 0, self.min, np.where(q == 1, self.max, out))
+        return out[()]
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def cdf(self, x):
+        """Fraction of values less than or equal to ``x``."""
+        x = np.asarray(x, dtype=np.float64)
+        if self.count == 0:
+            return np.full(x.shape, np.nan)[()]
+        items, ranks = self._weighted()
+        position = np.searchsorted(items, x, side='right')
+        below = np.where(position > 0, ranks[np.maximum(position - 1, 0)], 0)
+        return (below / self.count)[()]
+
+    def plot(self, ax=None, **kwargs):
+        """Draw the empirical CDF as a step line over the retained values,
+        in place of a cumulative histogram."""
+        if ax is None:
+            import matplotlib.pyplot as plt
+            ax = plt.gca()
+        items, ranks = self._weighted()
+        return ax.step(items, ranks / self.count, where='post', **kwargs)
+
+
+def sketch(data, axis=None, k=200, seed=None):
+    """Sketch every value of ``data``, or each column of it.
+
+    Parameters
+    ----------
+    data : np.ndarray, pd.Series or pd.DataFrame
+        Values; NaNs are skipped.
+    axis : {None, 0}
+        None gives one sketch of all values, as ``np.median(data)`` reads;
+        0 gives one per column, as ``data.median()`` reads.
+    k, seed
+        See :class:`QuantileSketch`.
+
+    Returns
+    -------
+    QuantileSketch, or a list of them (a ``pd.Series`` indexed by the columns
+    of a DataFrame) when ``axis`` is 0.
+    """
+    values = np.asarray(getattr(data, 'values', data), dtype=np.float64)
+    if axis is None:
+        return QuantileSketch(k, seed).update(values)
+    if axis != 0:
+        raise ValueError('axis must be None or 0')
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    sketches = [QuantileSketch(k, seed).update(values[:, j])
+                for j in range(values.shape[1])]
+    if isinstance(data, pd.DataFrame):
+        return pd.Series(sketches, index=data.columns, dtype=object)
+    return sketches
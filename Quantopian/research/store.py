@@ -0,0 +1,546 @@
+"""
+Local, memory-mapped columnar price store with a drop-in ``get_pricing``.
+
+The hosted research environment exposes ``get_pricing`` as a builtin. This
+module provides a local replacement backed by a directory on disk, laid out as
+one contiguous float64 file per (asset, field) plus a shared int64 date axis.
+Reads page in only the requested slice of each column, so a multi-year pull
+for hundreds of symbols costs a handful of memory copies.
+
+The store also keeps pre-aggregated weekly, monthly and quarterly bars in the
+same layout. They are brought up to date whenever daily bars are appended,
+by rebuilding only the periods the new bars fall into, so coarse queries read
+straight from disk.
+
+Layout::
+
+    <root>/meta.json                  fields, assets, levels and row counts
+    <root>/dates.i8                   int64 nanoseconds since the epoch (UTC)
+    <root>/<sid>/<field>.f8           float64 values aligned with dates.i8
+    <root>/levels/<level>/dates.i8    period labels of a pre-aggregated level
+    <root>/levels/<level>/<sid>/<field>.f8
+"""
+from __future__ import absolute_import, division, print_function
+
+import errno
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from ._time import index_nanos, nanos_index, to_nanos
+from .assets import Equity
+from .resample import Buckets
+
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+FIELDS = ('open_price', 'high', 'low', 'close_price', 'volume', 'price')
+
+# Pre-aggregated levels and the resampling rule of each.
+LEVELS = ('weekly', 'monthly', 'quarterly')
+_LEVEL_RULES = {'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q'}
+
+# How each field is aggregated into a coarser bar; other fields take the last
+# value of the period.
+_LEVEL_REDUCTIONS = {
+    'open_price': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close_price': 'last',
+    'price': 'last',
+    'volume': 'sum',
+}
+_DAY_NANOS = 24 * 60 * 60 * 10 ** 9
+
+_META_FILE = 'meta.json'
+_DATES_FILE = 'dates.i8'
+_DATE_DTYPE = np.dtype('<i8')
+_VALUE_DTYPE = np.dtype('<f8')
+
+_price_store = None
+
+
+class SymbolNotFound(KeyError):
+    """Raised when a requested symbol is not present in the store."""
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _symbol_of(key):
+    return getattr(key, 'symbol', key)
+
+
+def _truncate(path, nbytes, fill=np.nan):
+    """Cut ``path`` to ``nbytes``, padding a shorter (or missing) file with
+    ``fill`` so columns of newly added assets line up with existing rows."""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size > nbytes:
+        with open(path, 'r+b') as f:
+            f.truncate(nbytes)
+    elif size < nbytes:
+        with open(path, 'ab') as f:
+            f.write(np.full((nbytes - size) // 8, fill).tobytes())
+
+
+class PriceStore(object):
+    """Daily bars for many assets stored as memory-mapped columns.
+
+    Parameters
+    ----------
+    root : str
+        Directory created by :meth:`PriceStore.create`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, _META_FILE)) as f:
+            meta = json.load(f)
+        self.fields = tuple(meta['fields'])
+        self.levels = tuple(meta.get('levels', ()))
+        self._length = meta['length']
+        self._level_lengths = dict(meta.get('level_lengths', {}))
+        self._assets = [
+            Equity(a['sid'], a['symbol'],
+                   None if a['start'] is None else nanos_index([a['start']])[0],
+                   None if a['end'] is None else nanos_index([a['end']])[0])
+            for a in meta['assets']
+        ]
+        self._by_symbol = dict((a.symbol, a) for a in self._assets)
+        self._maps = {}
+
+    @classmethod
+    def create(cls, root, fields=FIELDS, levels=LEVELS):
+        """Initialise an empty store at ``root`` and open it.
+
+        ``levels`` selects which of ``LEVELS`` are kept pre-aggregated.
+        """
+        unknown = set(levels) - set(LEVELS)
+        if unknown:
+            raise ValueError('unknown levels: %s' % sorted(unknown))
+        _makedirs(root)
+        meta_path = os.path.join(root, _META_FILE)
+        if os.path.exists(meta_path):
+            raise ValueError('a price store already exists at %r' % root)
+        open(os.path.join(root, _DATES_FILE), 'wb').close()
+        for level in levels:
+            _makedirs(os.path.join(root, 'levels', level))
+            open(os.path.join(root, 'levels', level, _DATES_FILE),
+                 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump({'fields': list(fields),
+                       'levels': list(levels),
+                       'length': 0,
+                       'level_lengths': dict((level, 0) for level in levels),
+                       'assets': []}, f)
+        return cls(root)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def assets(self):
+        return list(self._assets)
+
+    @property
+    def symbols(self):
+        return [a.symbol for a in self._assets]
+
+    @property
+    def dates(self):
+        """The shared date axis as a UTC DatetimeIndex."""
+        return nanos_index(self._date_nanos())
+
+    def level_dates(self, level):
+        """Period labels of a pre-aggregated level."""
+        return nanos_index(self._date_nanos(self._check_level(level)))
+
+    def lookup(self, symbol):
+        """Return the :class:`Equity` for ``symbol``."""
+        if isinstance(symbol, Equity):
+            symbol = symbol.symbol
+        try:
+            return self._by_symbol[symbol]
+        except KeyError:
+            raise SymbolNotFound(symbol)
+
+    # Low-level column access.
+
+    def _check_level(self, level):
+        if level is not None and level not in self.levels:
+            raise ValueError('level %r is not kept by this store' % (level,))
+        return level
+
+    def _dir(self, level=None):
+        if level is None:
+            return self.root
+        return os.path.join(self.root, 'levels', level)
+
+    def _path(self, sid, field, level=None):
+        return os.path.join(self._dir(level), str(sid), field + '.f8')
+
+    def _rows(self, level=None):
+        return self._length if level is None else self._level_lengths[level]
+
+    def _map(self, key, path, dtype, level=None):
+        try:
+            return self._maps[key]
+        except KeyError:
+            pass
+        length = self._rows(level)
+        if length == 0:
+            mapped = np.empty(0, dtype=dtype)
+        else:
+            mapped = np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+        self._maps[key] = mapped
+        return mapped
+
+    def _date_nanos(self, level=None):
+        return self._map((level, None),
+                         os.path.join(self._dir(level), _DATES_FILE),
+                         _DATE_DTYPE, level)
+
+    def column(self, asset, field, level=None):
+        """Return the full memory-mapped column for ``asset`` and ``field``,
+        daily or from a pre-aggregated ``level``."""
+        if field not in self.fields:
+            raise ValueError('unknown field %r' % (field,))
+        sid = self.lookup(asset).sid
+        return self._map((level, sid, field), self._path(sid, field, level),
+                         _VALUE_DTYPE, level)
+
+    def bounds(self, start=None, end=None, level=None):
+        """Return the ``[lo, hi)`` row positions covering ``[start, end]``."""
+        dates = self._date_nanos(level)
+        lo = 0 if start is None else int(
+            np.searchsorted(dates, to_nanos(start), side='left'))
+        hi = self._rows(level) if end is None else int(
+            np.searchsorted(dates, to_nanos(end), side='right'))
+        return lo, max(lo, hi)
+
+    def read(self, assets, fields, start=None, end=None, start_offset=0,
+             level=None):
+        """Read a block of values, daily or from a pre-aggregated ``level``.
+
+        Returns
+        -------
+        index : pd.DatetimeIndex
+        values : np.ndarray[float64]
+            Array of shape ``(len(fields), len(assets), len(index))``.
+        """
+        self._check_level(level)
+        lo, hi = self.bounds(start, end, level)
+        lo = max(lo - start_offset, 0)
+        out = np.empty((len(fields), len(assets), hi - lo))
+        for i, field in enumerate(fields):
+            for j, asset in enumerate(assets):
+                out[i, j] = self.column(asset, field, level)[lo:hi]
+        return nanos_index(self._date_nanos(level)[lo:hi]), out
+
+    # Writing.
+
+    def append(self, data):
+        """Append new bars to the store.
+
+        Parameters
+        ----------
+        data : dict[str -> pd.DataFrame]
+            Maps field names to frames indexed by timestamps strictly after the
+            last date already stored, with one column per symbol. Symbols not
+            yet in the store are added; missing fields and symbols are written
+            as NaN.
+        """
+        unknown = set(data) - set(self.fields)
+        if unknown:
+            raise ValueError('unknown fields: %s' % sorted(unknown))
+        if not data:
+            return
+
+        frames = {}
+        index = None
+        symbols = []
+        seen = set()
+        for field, frame in data.items():
+            frame = frame.rename(columns=_symbol_of)
+            frame.index = pd.DatetimeIndex(frame.index)
+            if frame.index.tz is None:
+                frame.index = frame.index.tz_localize('UTC')
+            frames[field] = frame
+            index = frame.index if index is None else index.union(frame.index)
+            for symbol in frame.columns:
+                if symbol not in seen:
+                    seen.add(symbol)
+                    symbols.append(symbol)
+        nanos = index_nanos(index)
+        if len(nanos) == 0:
+            return
+        if (np.diff(nanos) <= 0).any():
+            raise ValueError('appended dates must be unique and sorted')
+        if self._length and nanos[0] <= self._date_nanos()[-1]:
+            raise ValueError('appended dates must follow the last stored date')
+
+        # Convert every input before touching disk, so a bad column cannot
+        # leave a partial append behind.
+        columns = {}
+        for field, frame in frames.items():
+            frame = frame.reindex(index)
+            try:
+                block = np.asarray(frame.values, dtype=_VALUE_DTYPE)
+            except (TypeError, ValueError) as e:
+                raise ValueError('field %r is not numeric: %s' % (field, e))
+            for j, symbol in enumerate(frame.columns):
+                columns[field, symbol] = block[:, j]
+
+        new_assets = [Equity(len(self._assets) + i, symbol)
+                      for i, symbol in enumerate(
+                          s for s in symbols if s not in self._by_symbol)]
+        meta_assets = [self._asset_meta(a)
+                       for a in self._assets + new_assets]
+        missing = np.full(len(nanos), np.nan, dtype=_VALUE_DTYPE)
+        nbytes = self._length * _VALUE_DTYPE.itemsize
+        for asset, asset_meta in zip(self._assets + new_assets, meta_assets):
+            _makedirs(os.path.join(self.root, str(asset.sid)))
+            valid = np.zeros(len(nanos), dtype=bool)
+            for field in self.fields:
+                values = columns.get((field, asset.symbol), missing)
+                valid |= ~np.isnan(values)
+                # Drop bytes a failed earlier append may have left, and
+                # backfill the columns of new assets with NaN.
+                path = self._path(asset.sid, field)
+                _truncate(path, nbytes)
+                with open(path, 'ab') as f:
+                    f.write(values.tobytes())
+            if valid.any():
+                positions = np.flatnonzero(valid)
+                if asset_meta['start'] is None:
+                    asset_meta['start'] = int(nanos[positions[0]])
+                asset_meta['end'] = int(nanos[positions[-1]])
+
+        path = os.path.join(self.root, _DATES_FILE)
+        _truncate(path, self._length * _DATE_DTYPE.itemsize)
+        with open(path, 'ab') as f:
+            f.write(nanos.astype(_DATE_DTYPE).tobytes())
+
+        # Only now that every file is written does the store take on the
+        # new assets, dates and rows.
+        for asset in new_assets:
+            self._assets.append(asset)
+            self._by_symbol[asset.symbol] = asset
+        for asset, asset_meta in zip(self._assets, meta_assets):
+            if asset_meta['start'] is not None:
+                asset.start_date = nanos_index([asset_meta['start']])[0]
+                asset.end_date = nanos_index([asset_meta['end']])[0]
+        self._length += len(nanos)
+        self._maps.clear()
+        self._update_levels(int(nanos[0]))
+        self._write_meta(meta_assets)
+
+    def rebuild_levels(self):
+        """Recompute every pre-aggregated level from the daily bars."""
+        if self._length:
+            self._update_levels(int(self._date_nanos()[0]))
+            self._write_meta([self._asset_meta(a) for a in self._assets])
+
+    def _update_levels(self, first_new):
+        """Rebuild the level periods at or after ``first_new``.
+
+        Periods that closed before the first new bar are kept as they are;
+        the last, possibly partial, period and any new ones are recomputed
+        from the daily columns and appended.
+        """
+        daily = self._date_nanos()
+        for level in self.levels:
+            edges = self._date_nanos(level) + _DAY_NANOS
+            keep = int(np.searchsorted(edges, first_new, side='right'))
+            lo = 0 if keep == 0 else int(
+                np.searchsorted(daily, edges[keep - 1], side='left'))
+            buckets = Buckets(nanos_index(daily[lo:]), _LEVEL_RULES[level])
+
+            _truncate(os.path.join(self._dir(level), _DATES_FILE),
+                      keep * 8)
+            with open(os.path.join(self._dir(level), _DATES_FILE), 'ab') as f:
+                f.write(index_nanos(buckets.labels).astype(_DATE_DTYPE)
+                        .tobytes())
+
+            for field in self.fields:
+                block = np.empty((self._length - lo, len(self._assets)))
+                for j, asset in enumerate(self._assets):
+                    block[:, j] = self.column(asset, field)[lo:]
+                how = _LEVEL_REDUCTIONS.get(field, 'last')
+                reduced = buckets.reduce(block, how)
+                for j, asset in enumerate(self._assets):
+                    _makedirs(os.path.join(self._dir(level), str(asset.sid)))
+                    path = self._path(asset.sid, field, level)
+                    # Periods before an asset was added aggregate all-NaN
+                    # daily bars: 0 for sums, NaN otherwise.
+                    _truncate(path, keep * 8,
+                              0.0 if how == 'sum' else np.nan)
+                    with open(path, 'ab') as f:
+                        f.write(reduced[:, j].astype(_VALUE_DTYPE).tobytes())
+            self._level_lengths[level] = keep + len(buckets)
+        self._maps.clear()
+
+    def _asset_meta(self, asset):
+        return {
+            'sid': asset.sid,
+            'symbol': asset.symbol,
+            'start': None if asset.start_date is None
+            else to_nanos(asset.start_date),
+            'end': None if asset.end_date is None else to_nanos(asset.end_date),
+        }
+
+    def _write_meta(self, meta_assets):
+        path = os.path.join(self.root, _META_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'fields': list(self.fields),
+                       'levels': list(self.levels),
+                       'length': self._length,
+                       'level_lengths': self._level_lengths,
+                       'assets': meta_assets}, f)
+        os.rename(tmp, path)
+
+    # Research API.
+
+    def _resolve(self, symbols, handle_missing):
+        assets = []
+        for symbol in symbols:
+            try:
+                assets.append(self.lookup(symbol))
+            except SymbolNotFound:
+                if handle_missing == 'raise':
+                    raise
+                if handle_missing == 'log':
+                    warnings.warn('no pricing data for %r' % (symbol,))
+        return assets
+
+    def get_pricing(self, symbols, start_date=None, end_date=None,
+                    symbol_reference_date=None, frequency='daily',
+                    fields=None, handle_missing='raise', start_offset=0):
+        """Load pricing data with the same call signature and return shapes as
+        the hosted ``get_pricing`` builtin.
+
+        Parameters
+        ----------
+        symbols : str, Equity or list
+            One asset or a list of assets.
+        start_date, end_date : date-like, optional
+            Inclusive bounds; default to the full stored range.
+        symbol_reference_date : date-like, optional
+            Accepted for signature compatibility; symbols are resolved against
+            the current mapping.
+        frequency : {'daily', 'weekly', 'monthly', 'quarterly'}
+            Bar frequency. Coarser frequencies are read from the
+            pre-aggregated levels, labelled by period end.
+        fields : str or list of str, optional
+            Field or fields to load; defaults to all stored fields.
+        handle_missing : {'raise', 'log', 'ignore'}
+            What to do when a symbol is not in the store.
+        start_offset : int
+            Number of extra bars to include before ``start_date``.
+
+        Returns
+        -------
+        pd.Series or pd.DataFrame
+            A Series for one asset and one field, a DataFrame with field
+            columns for one asset, a DataFrame with Equity columns for one
+            field, and a DataFrame with (field, Equity) MultiIndex columns
+            otherwise.
+        """
+        if frequency == 'daily':
+            level = None
+        elif frequency in self.levels:
+            level = frequency
+        else:
+            raise ValueError('unsupported frequency %r' % (frequency,))
+        single_asset = isinstance(symbols, string_types + (Equity,))
+        if single_asset:
+            assets = self._resolve([symbols], 'raise')
+        else:
+            assets = self._resolve(symbols, handle_missing)
+
+        single_field = isinstance(fields, string_types)
+        if fields is None:
+            fields = list(self.fields)
+        elif single_field:
+            fields = [fields]
+        else:
+            fields = list(fields)
+        for field in fields:
+            if field not in self.fields:
+                raise ValueError('unknown field %r' % (field,))
+
+        index, values = self.read(assets, fields, start_date, end_date,
+                                  start_offset, level)
+        return _frame(index, values, assets, fields, single_asset, single_field)
+
+
+def _frame(index, values, assets, fields, single_asset, single_field):
+    """Shape a ``(fields, assets, dates)`` block like the hosted builtin,
+    wrapping it without a copy."""
+    if single_asset:
+        if single_field:
+            return pd.Series(values[0, 0], index=index, name=assets[0],
+                             copy=False)
+        return pd.DataFrame(values[:, 0].T, index=index, columns=fields,
+                            copy=False)
+    if single_field:
+        return pd.DataFrame(values[0].T, index=index, columns=assets,
+                            copy=False)
+    columns = pd.MultiIndex.from_product([fields, assets])
+    flat = values.reshape(len(fields) * len(assets), len(index))
+    return pd.DataFrame(flat.T, index=index, columns=columns, copy=False)
+
+
+def set_price_store(store):
+    """Set the store used by the module-level :func:`get_pricing`.
+
+    ``store`` may be a :class:`PriceStore` or the path to one.
+    """
+    global _price_store
+    if isinstance(store, string_types):
+        store = PriceStore(store)
+    _price_store = store
+
+
+def get_price_store():
+    """Return the configured store, opening ``$QUANTOPIAN_PRICE_STORE`` if no
+    store has been set explicitly."""
+    if _price_store is None:
+        root = os.environ.get('QUANTOPIAN_PRICE_STORE')
+        if root is None:
+            raise RuntimeError(
+                'no price store configured; call set_price_store() or set '
+                'QUANTOPIAN_PRICE_STORE'
+            )
+        set_price_store(root)
+    return _price_store
+
+
+def get_pricing(symbols, start_date=None, end_date=None,
+                symbol_reference_date=None, frequency='daily', fields=None,
+                handle_missing='raise', start_offset=0):
+    """Drop-in replacement for the hosted ``get_pricing`` builtin.
+
+    See :meth:`PriceStore.get_pricing` for the parameters.
+    """
+    return get_price_store().get_pricing(
+        symbols,
+        start_date=start_date,
+        end_date=end_date,
+        symbol_reference_date=symbol_reference_date,
+        frequency=frequency,
+        fields=fields,
+        handle_missing=handle_missing,
+        start_offset=start_offset,
+    )
@@ -0,0 +1,173 @@
+"""
+Timezone conversion with cached UTC-offset tables.
+
+``Panda.py`` converts with ``prices.tz_convert('US/Eastern')``. Converting a
+DatetimeIndex only relabels its zone, but every frame and every field access
+then works out local times from the zone rules again, which on years of
+minute bars is a noticeable cost repeated for each symbol sharing the same
+index. Here converted indexes are cached per buffer of timestamps, so every
+frame and column sharing an index reuses the same converted index without
+copying its values, and the offset transitions of a zone are tabulated once
+per (zone, range of years) so that local wall-clock times are a binary search
+into that table, computed only when asked for.
+"""
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ._time import index_nanos, nanos_index, to_nanos
+
+_STEP_NANOS = 6 * 60 * 60 * 10 ** 9
+_MAX_ENTRIES = 32
+_tables = OrderedDict()
+_indexes = OrderedDict()
+
+
+def _lru_get(cache, key):
+    if key in cache:
+        cache[key] = cache.pop(key)
+        return cache[key]
+    return None
+
+
+def _lru_put(cache, key, value):
+    cache[key] = value
+    while len(cache) > _MAX_ENTRIES:
+        cache.popitem(last=False)
+    return value
+
+
+def _sample_offsets(zone, nanos):
+    """UTC offsets of ``zone`` at the UTC instants ``nanos``, from pandas."""
+    local = nanos_index(nanos, tz=zone).tz_localize(None)
+    return index_nanos(local) - nanos
+
+
+def _year_nanos(year):
+    return pd.Timestamp(year=year, month=1, day=1, tz='UTC').value
+
+
+def offset_table(zone, start, end):
+    """Offset transitions of ``zone`` covering ``[start, end]``.
+
+    The range is widened to whole years and the table is cached, so queries
+    over overlapping periods share it.
+
+    Returns
+    -------
+    transitions : np.ndarray[int64]
+        UTC nanoseconds at which an offset takes effect; the first entry is
+        the start of the range.
+    offsets : np.ndarray[int64]
+        Offset from UTC in nanoseconds in effect from each transition.
+    """
+    zone = str(zone)
+    first, last = nanos_index([to_nanos(start), to_nanos(end)]).year
+    key = (zone, first, last)
+    table = _lru_get(_tables, key)
+    if table is not None:
+        return table
+
+    lo, hi = _year_nanos(first), _year_nanos(last + 1)
+    samples = np.arange(0, hi - lo + 1, _STEP_NANOS, dtype=np.int64) + lo
+    offsets = _sample_offsets(zone, samples)
+    changed = np.flatnonzero(np.diff(offsets)) + 1
+    # Each change lies in (samples[i - 1], samples[i]]; bisect all of them
+    # together down to the nanosecond.
+    before = samples[changed - 1]
+    after = samples[changed].copy()
+    while len(changed) and (after - before > 1).any():
+        mid = before + (after - before) // 2
+        moved = _sample_offsets(zone, mid) != offsets[changed - 1]
+        after = np.where(moved, mid, after)
+        before = np.where(moved, before, mid)
+    transitions = np.concatenate([[lo], after]).astype(np.int64)
+    values = np.concatenate([offsets[:1], offsets[changed]]).astype(np.int64)
+    transitions.flags.writeable = False
+    values.flags.writeable = False
+    return _lru_put(_tables, key, (transitions, values))
+
+
+def utc_offsets(index, zone):
+    """UTC offset of ``zone`` in nanoseconds at every timestamp of ``index``
+    (naive timestamps are taken as UTC)."""
+    nanos = index if isinstance(index, np.ndarray) else index_nanos(index)
+    if not len(nanos):
+        return np.zeros(0, dtype=np.int64)
+    transitions, offsets = offset_table(zone, nanos_index(nanos[:1])[0],
+                                        nanos_index(nanos[-1:])[0])
+    return offsets[np.searchsorted(transitions, nanos, side='right') - 1]
+
+
+def _converted(index, zone):
+    """Cached ``[timestamps, converted index, wall-clock nanoseconds or
+    None]``.
+
+    The indexes of different columns of a frame are distinct objects sharing
+    one buffer of timestamps, so entries are keyed by that buffer (its
+    address, length, strides and unit) and the zone, and hold a reference to
+    it so that the address cannot be reused while the entry is cached. A hit
+    costs nothing proportional to the length of the index.
+    """
+    utc = index if isinstance(index, pd.DatetimeIndex) \
+        else pd.DatetimeIndex(index)
+    # .values of a tz-aware index is its UTC buffer, without a copy.
+    values = utc.values
+    key = (values.__array_interface__['data'][0], len(values), values.strides,
+           values.dtype.str, str(utc.tz), str(zone))
+    cached = isinstance(index, pd.Index)
+    entry = _lru_get(_indexes, key) if cached else None
+    if entry is not None:
+        return entry
+    if utc.tz is None:
+        utc = utc.tz_localize('UTC')
+    entry = [values, utc.tz_convert(zone), None]
+    if cached:
+        _lru_put(_indexes, key, entry)
+    return entry
+
+
+def local_nanos(index, zone):
+    """Wall-clock time in ``zone`` of every timestamp, as int64 nanoseconds.
+
+    Useful for grouping minute bars by local date or time of day without
+    going through pandas' per-access field computation, e.g.
+    ``local_nanos(index, zone) // (24 * 3600 * 10 ** 9)`` for local dates.
+    Computed from the offset table on first use and cached with the
+    converted index.
+    """
+    entry = _converted(index, zone)
+    if entry[2] is None:
+        nanos = index_nanos(entry[1])
+        local = nanos + utc_offsets(nanos, zone)
+        local.flags.writeable = False
+        entry[2] = local
+    return entry[2]
+
+
+def convert_index(index, zone):
+    """Return ``index`` converted to ``zone``.
+
+    The conversion only relabels the zone of the UTC values. The result is
+    cached per index object, so converting the same index again, e.g. for
+    the next symbol of a panel, returns the same object.
+    """
+    return _converted(index, zone)[1]
+
+
+def tz_convert(data, zone):
+    """Equivalent of ``data.tz_convert(zone)`` for a Series or DataFrame, or
+    a dict of them, that shares the converted index and does not copy the
+    values.
+
+    Naive indexes are taken to be in UTC, as everywhere in this package.
+    """
+    if isinstance(data, dict):
+        return dict((key, tz_convert(value, zone))
+                    for key, value in data.items())
+    out = data.copy(deep=False)
+    out.index = convert_index(data.index, zone)
+    return out